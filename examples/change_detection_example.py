@@ -13,14 +13,17 @@ This example demonstrates the complete workflow:
 
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import matplotlib.pyplot as plt
+import rasterio
+import matplotlib
+matplotlib.use('Agg')  # Non-interactive backend, figures are only written to disk
 from datetime import datetime
 
 # Add parent directory to path to import sar4cet
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from sar4cet import preprocessing, change_detection, visualization
+from sar4cet import preprocessing, change_detection
 
 # Define area of interest (AOI) - Example: San Francisco Bay Area
 aoi = [-122.5, 37.5, -122.0, 38.0]  # [lon_min, lat_min, lon_max, lat_max]
@@ -61,19 +64,27 @@ def main():
         
         # Step 4: Visualize results
         print("\nVisualizing results...")
-        # Plot change detection results
-        fig = visualization.plot_changes(changes, output_file='results/change_detection_results.png')
-        plt.close(fig)
+        # Plotting imports are deferred until needed, they dominate start-up time
+        import matplotlib.pyplot as plt
+        from sar4cet import visualization
         
-        # Create RGB composite
-        fig = visualization.create_rgb_change_composite(changes, output_file='results/change_rgb_composite.png')
-        plt.close(fig)
-        
-        # Plot time series for selected points
-        # Select a few points with changes
+        # Select a few points with changes for the time series plot
         points = [(100, 100), (150, 150), (200, 200)]
-        fig = visualization.plot_time_series(images, points, output_file='results/time_series.png')
-        plt.close(fig)
+        
+        # Build the figures, then render and encode them concurrently
+        figures = {
+            'results/change_detection_results.png': visualization.plot_changes(changes),
+            'results/change_rgb_composite.png': visualization.create_rgb_change_composite(changes),
+            'results/time_series.png': visualization.plot_time_series(images, points),
+        }
+        with ThreadPoolExecutor(max_workers=len(figures)) as executor:
+            futures = [executor.submit(fig.savefig, path, dpi=300, bbox_inches='tight')
+                       for path, fig in figures.items()]
+            for future in futures:
+                future.result()
+        
+        for fig in figures.values():
+            plt.close(fig)
         
         print("\nResults saved to 'results' directory.")
         print("Done!")
@@ -97,7 +108,7 @@ def simulate_sample_data():
     
     return simulated_files
 
-def load_images(file_paths):
+def load_images(file_paths, scratch_file=None):
     """
     Load images from file paths or create simulated data if files don't exist.
     
@@ -105,6 +116,9 @@ def load_images(file_paths):
     ----------
     file_paths : list
         List of image file paths
+    scratch_file : str, optional
+        If given, real images are stacked into a memory-mapped array backed by
+        this file, so stacks larger than RAM can be processed, by default None
     
     Returns
     -------
@@ -112,51 +126,107 @@ def load_images(file_paths):
         3D array of images (time, height, width)
     """
     # Check if files exist
-    if all(os.path.exists(f) for f in file_paths):
-        # Load actual images (implementation depends on file format)
-        # This is a placeholder - in a real implementation, you would load the actual images
+    if file_paths and all(os.path.exists(f) for f in file_paths):
         print("Loading actual image data...")
-        # Placeholder implementation
-        images = [np.ones((512, 512)) for _ in file_paths]
+        
+        # Get raster dimensions from the first file
+        with rasterio.open(file_paths[0]) as src:
+            height, width = src.height, src.width
+        
+        # Read each image straight into its slice of a pre-allocated stack
+        shape = (len(file_paths), height, width)
+        if scratch_file is not None:
+            images = np.memmap(scratch_file, dtype=np.float32, mode='w+', shape=shape)
+        else:
+            images = np.empty(shape, dtype=np.float32)
+        
+        # A shared GDAL environment lets the block cache and decompression
+        # threads be reused across all the files
+        with rasterio.Env(GDAL_CACHEMAX=512, GDAL_NUM_THREADS='ALL_CPUS', VSI_CACHE=True):
+            for t, path in enumerate(file_paths):
+                with rasterio.open(path) as src:
+                    src.read(1, out=images[t])
+        
+        if scratch_file is not None:
+            images.flush()
     else:
         # Create simulated data
         print("Creating simulated image data...")
         
+        rng = np.random.default_rng()
+        shape = (512, 512)
+        
         # Create a 3D array with 5 time steps and 512x512 spatial dimensions
-        images = np.zeros((5, 512, 512))
+        # (float32 is sufficient for SAR intensities and halves memory traffic)
+        images = np.empty((5,) + shape, dtype=np.float32)
         
-        # Base landscape - random terrain
-        base = np.random.normal(0, 1, (512, 512))
-        base = np.exp(base)  # Make it positive (like SAR backscatter)
+        # Base landscape - random terrain, log-normal to keep it positive (like SAR backscatter)
+        base = rng.lognormal(0, 1, shape).astype(np.float32)
         
-        # Add some structures
-        for i in range(50):
-            x = np.random.randint(0, 512)
-            y = np.random.randint(0, 512)
-            size = np.random.randint(10, 50)
-            base[max(0, x-size//2):min(512, x+size//2), max(0, y-size//2):min(512, y+size//2)] += np.random.uniform(1, 3)
+        # Add some structures (all 50 drawn and rasterized in one go)
+        base += _rectangle_field(shape,
+                                 rng.integers(0, 512, size=50),
+                                 rng.integers(0, 512, size=50),
+                                 rng.integers(10, 50, size=50),
+                                 rng.uniform(1, 3, size=50))
         
         # Normalize
         base = base / base.max()
         
         # Create time series with changes
+        rows = rng.integers(0, 512, size=(5, 10))
+        cols = rng.integers(0, 512, size=(5, 10))
+        sizes = rng.integers(10, 30, size=(5, 10))
+        change_values = rng.uniform(0.5, 2.0, size=(5, 10))
         for t in range(5):
-            images[t] = base.copy()
-            
-            # Add some changes in each time step
-            for i in range(10):
-                x = np.random.randint(0, 512)
-                y = np.random.randint(0, 512)
-                size = np.random.randint(10, 30)
-                change_value = np.random.uniform(0.5, 2.0)
-                images[t, max(0, x-size//2):min(512, x+size//2), max(0, y-size//2):min(512, y+size//2)] *= change_value
-        
-        # Add speckle noise (characteristic of SAR)
-        for t in range(5):
-            speckle = np.random.gamma(shape=1.0, scale=0.3, size=(512, 512))
-            images[t] *= speckle
+            # Overlapping multiplicative changes add up in log space
+            log_change = _rectangle_field(shape, rows[t], cols[t], sizes[t], np.log(change_values[t]))
+            np.multiply(base, np.exp(log_change), out=images[t])
+        
+        # Add speckle noise (characteristic of SAR), drawn for the whole series at once
+        speckle = rng.standard_gamma(1.0, size=images.shape, dtype=np.float32)
+        speckle *= 0.3
+        images *= speckle
+    
+    return images
+
+def _rectangle_field(shape, rows, cols, sizes, values):
+    """
+    Rasterize a set of constant-valued, possibly overlapping squares.
+    
+    The squares are accumulated in a 2D difference array and integrated
+    with two cumulative sums, so the cost does not depend on their number.
+    
+    Parameters
+    ----------
+    shape : tuple
+        Output shape as (height, width)
+    rows, cols : numpy.ndarray
+        Square centres
+    sizes : numpy.ndarray
+        Square side lengths in pixels
+    values : numpy.ndarray
+        Value added inside each square
+    
+    Returns
+    -------
+    numpy.ndarray
+        2D array holding the sum of all squares
+    """
+    height, width = shape
+    half = np.asarray(sizes) // 2
+    r0 = np.clip(rows - half, 0, height)
+    r1 = np.clip(rows + half, 0, height)
+    c0 = np.clip(cols - half, 0, width)
+    c1 = np.clip(cols + half, 0, width)
+    
+    delta = np.zeros((height + 1, width + 1))
+    np.add.at(delta, (r0, c0), values)
+    np.add.at(delta, (r0, c1), np.negative(values))
+    np.add.at(delta, (r1, c0), np.negative(values))
+    np.add.at(delta, (r1, c1), values)
     
-    return np.stack(images, axis=0)
+    return delta.cumsum(axis=0).cumsum(axis=1)[:height, :width]
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -9,6 +9,8 @@ including tank volume estimation, traffic analysis, and anomaly detection.
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
@@ -28,6 +30,53 @@ from sar4cet.oil_monitoring import (
 )
 
 
+@lru_cache(maxsize=8)
+def _terrain(height, width):
+    """
+    Smooth synthetic terrain pattern, cached per image size.
+    
+    Parameters
+    ----------
+    height, width : int
+        Image size
+    
+    Returns
+    -------
+    numpy.ndarray
+        Read-only 2D terrain array
+    """
+    # Separable pattern: one sin/cos per column/row instead of per pixel
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)
+    terrain = 0.1 * np.outer(np.cos(8 * y), np.sin(10 * x))
+    terrain.setflags(write=False)
+    return terrain
+
+
+def _paint_disk(img, row, col, radius, value):
+    """
+    Set all pixels of an image within a disk to a constant value.
+    
+    Only the bounding box of the disk is visited, rather than building a
+    mask over the full image.
+    
+    Parameters
+    ----------
+    img : numpy.ndarray
+        2D image, modified in place
+    row, col : int
+        Center of the disk
+    radius : int
+        Radius of the disk in pixels
+    value : float
+        Value to assign
+    """
+    r0, r1 = max(0, row - radius), min(img.shape[0], row + radius + 1)
+    c0, c1 = max(0, col - radius), min(img.shape[1], col + radius + 1)
+    y_grid, x_grid = np.ogrid[r0-row:r1-row, c0-col:c1-col]
+    img[r0:r1, c0:c1][x_grid*x_grid + y_grid*y_grid <= radius*radius] = value
+
+
 def simulate_sar_data(num_images=5, image_size=(500, 500), num_tanks=5, seed=42):
     """
     Simulate SAR data for oil reservoir monitoring.
@@ -46,132 +95,196 @@ def simulate_sar_data(num_images=5, image_size=(500, 500), num_tanks=5, seed=42)
     Returns
     -------
     tuple
-        Tuple containing (image_series, timestamps, tank_locations)
+        Tuple containing (image_series, timestamps, tank_locations), where
+        image_series is a 3D array of images (time, height, width)
     """
-    np.random.seed(seed)
+    rng = np.random.default_rng(seed)
     
-    # Generate base image with some terrain features
-    base_image = np.random.normal(0.2, 0.05, image_size)
+    # Generate base image with some terrain features (float32 is plenty for
+    # values in [0, 1] and halves the memory of the stack)
+    base_image = rng.standard_normal(image_size, dtype=np.float32)
+    base_image *= 0.05
+    base_image += 0.2
     
     # Add some terrain features
-    x, y = np.meshgrid(np.linspace(0, 1, image_size[1]), np.linspace(0, 1, image_size[0]))
-    terrain = 0.1 * np.sin(10 * x) * np.cos(8 * y)
-    base_image += terrain
-    
-    # Generate tank locations
-    tank_locations = []
-    for _ in range(num_tanks):
-        row = np.random.randint(50, image_size[0] - 50)
-        col = np.random.randint(50, image_size[1] - 50)
-        radius = np.random.randint(10, 30)
-        tank_locations.append((row, col, radius))
-    
-    # Generate image series
-    image_series = []
+    base_image += _terrain(*image_size)
+    
+    # Generate tank locations (stored as one array per attribute)
+    tank_rows = rng.integers(50, image_size[0] - 50, size=num_tanks, dtype=np.int32)
+    tank_cols = rng.integers(50, image_size[1] - 50, size=num_tanks, dtype=np.int32)
+    tank_radii = rng.integers(10, 30, size=num_tanks, dtype=np.int32)
+    
+    # Tank bounding boxes and interior radii for all tanks at once
+    box_r0 = np.maximum(tank_rows - tank_radii, 0)
+    box_r1 = np.minimum(tank_rows + tank_radii + 1, image_size[0])
+    box_c0 = np.maximum(tank_cols - tank_radii, 0)
+    box_c1 = np.minimum(tank_cols + tank_radii + 1, image_size[1])
+    interior_radii = (tank_radii * 0.9).astype(np.int32)
+    
+    # Paint the parts of the tanks that do not change over time once, and
+    # keep the interior masks for the per-image fill
+    interior_masks = []
+    for k in range(num_tanks):
+        r0, r1, c0, c1 = box_r0[k], box_r1[k], box_c0[k], box_c1[k]
+        y_grid, x_grid = np.ogrid[r0-tank_rows[k]:r1-tank_rows[k], c0-tank_cols[k]:c1-tank_cols[k]]
+        dist_sq = x_grid*x_grid + y_grid*y_grid
+        
+        # Add tank with bright rim (the fill below darkens the center)
+        base_image[r0:r1, c0:c1][dist_sq <= tank_radii[k]**2] = 0.8
+        
+        # Create smaller mask for tank interior
+        interior_masks.append(dist_sq <= interior_radii[k]**2)
+    
+    # Draw the per-image randomness for all images up front: 1-3 vehicles
+    # near each tank, their offsets and sizes, and the additive noise
+    max_vehicles = 3
+    vehicle_counts = rng.integers(1, max_vehicles + 1, size=(num_images, num_tanks))
+    offset_range = 3 * tank_radii[None, :, None]
+    vehicle_row_offsets = rng.integers(-offset_range, offset_range, size=(num_images, num_tanks, max_vehicles))
+    vehicle_col_offsets = rng.integers(-offset_range, offset_range, size=(num_images, num_tanks, max_vehicles))
+    vehicle_sizes = rng.integers(2, 5, size=(num_images, num_tanks, max_vehicles))
+    noise = rng.standard_normal((num_images,) + tuple(image_size), dtype=np.float32)
+    noise *= 0.05
+    
+    # Position all vehicles near their tank, keeping only the drawn ones
+    # that fall within the image bounds
+    vehicle_rows = tank_rows[None, :, None] + vehicle_row_offsets
+    vehicle_cols = tank_cols[None, :, None] + vehicle_col_offsets
+    vehicle_valid = ((np.arange(max_vehicles) < vehicle_counts[..., None]) &
+                     (vehicle_rows >= 0) & (vehicle_rows < image_size[0]) &
+                     (vehicle_cols >= 0) & (vehicle_cols < image_size[1]))
+    
+    # Tank fill level varies over time
+    fill_levels = 0.5 + 0.3 * np.sin(np.arange(num_images) * np.pi / max(num_images - 1, 1))
+    
+    # Generate image series into a single pre-allocated stack
+    image_series = np.empty((num_images,) + tuple(image_size), dtype=base_image.dtype)
     timestamps = []
     
     base_time = datetime.now()
     
     for i in range(num_images):
-        # Create a copy of the base image
-        img = base_image.copy()
+        # Start from the base image
+        img = image_series[i]
+        np.copyto(img, base_image)
         
-        # Add tanks with varying fill levels
-        for row, col, radius in tank_locations:
-            # Tank fill level varies over time
-            fill_level = 0.5 + 0.3 * np.sin(i * np.pi / (num_images - 1))
-            
-            # Create tank
-            y_grid, x_grid = np.ogrid[-row:image_size[0]-row, -col:image_size[1]-col]
-            mask = x_grid*x_grid + y_grid*y_grid <= radius*radius
-            
-            # Add tank with bright rim and darker center based on fill level
-            img[mask] = 0.8  # Bright rim
-            
-            # Create smaller mask for tank interior
-            interior_radius = int(radius * 0.9)
-            interior_mask = x_grid*x_grid + y_grid*y_grid <= interior_radius*interior_radius
-            
-            # Fill tank based on fill level
-            fill_height = int(interior_radius * 2 * fill_level)
-            fill_start = row - interior_radius + (interior_radius * 2 - fill_height)
-            
-            # Create fill mask
-            fill_mask = interior_mask.copy()
-            fill_mask[:fill_start, :] = False
+        # Fill tanks based on fill level
+        fill_heights = (interior_radii * 2 * fill_levels[i]).astype(np.int32)
+        fill_starts = tank_rows - interior_radii + (interior_radii * 2 - fill_heights)
+        for k in range(num_tanks):
+            # The fill covers the interior rows from fill_start down, so the
+            # fill mask is simply a row slice of the interior mask (no copy)
+            start = max(fill_starts[k], box_r0[k])
+            fill_mask = interior_masks[k][start - box_r0[k]:]
             
             # Apply fill (darker than rim but brighter than background)
-            img[fill_mask] = 0.4
-        
-        # Add some vehicles/activity around tanks
-        for row, col, radius in tank_locations:
-            # Add 1-3 vehicles near each tank
-            num_vehicles = np.random.randint(1, 4)
-            for _ in range(num_vehicles):
-                # Position vehicle near tank
-                vehicle_row = row + np.random.randint(-radius*3, radius*3)
-                vehicle_col = col + np.random.randint(-radius*3, radius*3)
-                
-                # Ensure vehicle is within image bounds
-                if (0 <= vehicle_row < image_size[0] and 0 <= vehicle_col < image_size[1]):
-                    # Create small bright spot for vehicle
-                    vehicle_size = np.random.randint(2, 5)
-                    y_grid, x_grid = np.ogrid[-vehicle_row:image_size[0]-vehicle_row, 
-                                             -vehicle_col:image_size[1]-vehicle_col]
-                    vehicle_mask = x_grid*x_grid + y_grid*y_grid <= vehicle_size*vehicle_size
-                    img[vehicle_mask] = 0.9  # Very bright
+            img[start:box_r1[k], box_c0[k]:box_c1[k]][fill_mask] = 0.4
         
-        # Add some random noise
-        noise = np.random.normal(0, 0.05, image_size)
-        img += noise
-        
-        # Clip values to valid range
-        img = np.clip(img, 0, 1)
-        
-        # Add to series
-        image_series.append(img)
+        # Add some vehicles/activity around tanks as small, very bright spots
+        valid = vehicle_valid[i]
+        for vehicle_row, vehicle_col, vehicle_size in zip(vehicle_rows[i][valid].tolist(),
+                                                          vehicle_cols[i][valid].tolist(),
+                                                          vehicle_sizes[i][valid].tolist()):
+            _paint_disk(img, vehicle_row, vehicle_col, vehicle_size, 0.9)
         
         # Add timestamp (every 12 days for Sentinel-1 revisit)
         timestamps.append(base_time - timedelta(days=12 * (num_images - 1 - i)))
     
+    # Add some random noise and clip values to valid range, for all images at once
+    image_series += noise
+    np.clip(image_series, 0, 1, out=image_series)
+    
     # Add an anomaly in the last image
     if num_images > 0:
-        last_img = image_series[-1].copy()
-        
         # Choose a random tank to have an anomaly
-        anomaly_tank = tank_locations[np.random.randint(0, len(tank_locations))]
-        row, col, radius = anomaly_tank
+        k = rng.integers(num_tanks)
+        row, col, radius = int(tank_rows[k]), int(tank_cols[k]), int(tank_radii[k])
         
         # Create a spill-like pattern extending from the tank
         spill_length = radius * 3
         spill_width = radius * 1.5
-        spill_direction = np.random.uniform(0, 2 * np.pi)
+        spill_direction = rng.uniform(0, 2 * np.pi)
+        
+        # The spill lies within spill_length of the tank center, so only that
+        # window of the last image is touched (in place)
+        r0, r1 = max(0, row - spill_length), min(image_size[0], row + spill_length + 1)
+        c0, c1 = max(0, col - spill_length), min(image_size[1], col + spill_length + 1)
+        spill_view = image_series[-1, r0:r1, c0:c1]
+        
+        # Keep the annulus between the tank rim and the spill length, using
+        # exact integer squared distances so no window-sized float
+        # temporaries are needed
+        dr = np.arange(r0, r1)[:, None] - row
+        dc = np.arange(c0, c1)[None, :] - col
+        dist_sq = dr * dr + dc * dc
+        ring_rows, ring_cols = np.nonzero((radius * radius < dist_sq) & (dist_sq < spill_length * spill_length))
+        
+        # Calculate distance and angle from tank center for the annulus pixels only
+        ring_dr = dr[ring_rows, 0]
+        ring_dc = dc[0, ring_cols]
+        dist = np.hypot(ring_dr, ring_dc)
+        angle = np.arctan2(ring_dr, ring_dc)
         
-        for r in range(image_size[0]):
-            for c in range(image_size[1]):
-                # Calculate distance from tank center
-                dr = r - row
-                dc = c - col
-                dist = np.sqrt(dr*dr + dc*dc)
-                
-                # Calculate angle from tank center
-                angle = np.arctan2(dr, dc)
-                
-                # Check if point is in the spill pattern
-                angle_diff = np.abs((angle - spill_direction + np.pi) % (2 * np.pi) - np.pi)
-                if (radius < dist < spill_length and angle_diff < spill_width / dist):
-                    # Add spill effect (brighter than background)
-                    last_img[r, c] = 0.7 - 0.3 * (dist - radius) / spill_length
+        # Find points in the spill pattern. With the direction wrapped into
+        # [-pi, pi] like arctan2, the angular distance needs no float modulo
+        if spill_direction > np.pi:
+            spill_direction -= 2 * np.pi
+        angle_diff = np.pi - np.abs(np.abs(angle - spill_direction) - np.pi)
+        spill_mask = angle_diff * dist < spill_width
         
-        # Replace last image with anomaly
-        image_series[-1] = last_img
+        # Add spill effect (brighter than background)
+        spill_view[ring_rows[spill_mask], ring_cols[spill_mask]] = 0.7 - 0.3 * (dist[spill_mask] - radius) / spill_length
+    
+    tank_locations = list(zip(tank_rows.tolist(), tank_cols.tolist(), tank_radii.tolist()))
     
     return image_series, timestamps, tank_locations
 
 
-def main():
+def _save_geotiff(img, filename):
+    """
+    Save a single-band image as a tiled, compressed GeoTIFF.
+    
+    Parameters
+    ----------
+    img : numpy.ndarray
+        2D image to save
+    filename : str
+        Output file path
+    
+    Returns
+    -------
+    str
+        Output file path
+    """
+    with rasterio.open(
+        filename,
+        'w',
+        driver='GTiff',
+        height=img.shape[0],
+        width=img.shape[1],
+        count=1,
+        dtype=img.dtype,
+        crs='+proj=latlong',
+        transform=rasterio.transform.from_bounds(0, 0, 1, 1, img.shape[1], img.shape[0]),
+        tiled=True,
+        compress='deflate',
+        predictor=3 if np.issubdtype(img.dtype, np.floating) else 2
+    ) as dst:
+        dst.write(img, 1)
+    
+    return filename
+
+
+def main(save_geotiffs=True):
     """
     Main function to demonstrate oil reservoir monitoring.
+    
+    Parameters
+    ----------
+    save_geotiffs : bool, optional
+        Whether to write the simulated images as GeoTIFFs for reference,
+        by default True. The analysis works on the in-memory series, so the
+        files are only written once it has finished.
     """
     print("SAR4CET Oil Reservoir Monitoring Example")
     print("-" * 50)
@@ -188,26 +301,6 @@ def main():
     output_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'output')
     os.makedirs(output_dir, exist_ok=True)
     
-    # Save simulated images for reference
-    for i, (img, timestamp) in enumerate(zip(image_series, timestamps)):
-        filename = os.path.join(output_dir, f"simulated_sar_{i}.tif")
-        
-        # Create a simple GeoTIFF
-        with rasterio.open(
-            filename,
-            'w',
-            driver='GTiff',
-            height=img.shape[0],
-            width=img.shape[1],
-            count=1,
-            dtype=img.dtype,
-            crs='+proj=latlong',
-            transform=rasterio.transform.from_bounds(0, 0, 1, 1, img.shape[1], img.shape[0])
-        ) as dst:
-            dst.write(img, 1)
-        
-        print(f"Saved simulated image {i} to {filename}")
-    
     print("\n1. Tank Volume Estimation")
     print("-" * 30)
     
@@ -288,6 +381,15 @@ def main():
     plt.savefig(os.path.join(output_dir, "anomaly_detection.png"), dpi=300, bbox_inches='tight')
     plt.close(fig)
     
+    if save_geotiffs:
+        # Save simulated images for reference (GDAL releases the GIL, so the
+        # files are compressed and written concurrently)
+        print("\nSaving simulated images...")
+        filenames = [os.path.join(output_dir, f"simulated_sar_{i}.tif") for i in range(len(image_series))]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for i, filename in enumerate(executor.map(_save_geotiff, image_series, filenames)):
+                print(f"Saved simulated image {i} to {filename}")
+    
     print("\nAll results saved to:", output_dir)
     print("\nExample completed successfully!")
 
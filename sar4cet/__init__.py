@@ -2,8 +2,18 @@
 
 __version__ = '0.1.0'
 
-from . import preprocessing
-from . import change_detection
-from . import visualization
-from . import utils
-from . import oil_monitoring
\ No newline at end of file
+import importlib as _importlib
+
+# Subpackages are imported on first access, so that e.g. change detection
+# does not pay for the matplotlib, scikit-learn and OpenCV imports of the others
+_SUBPACKAGES = ('preprocessing', 'change_detection', 'visualization', 'utils', 'oil_monitoring')
+
+__all__ = list(_SUBPACKAGES)
+
+def __getattr__(name):
+    if name in _SUBPACKAGES:
+        return _importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + list(_SUBPACKAGES))
\ No newline at end of file
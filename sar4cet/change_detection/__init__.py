@@ -1 +1 @@
-from .methods import detect_changes, omnibus_test
\ No newline at end of file
+from .methods import detect_changes, detect_changes_windowed, generate_tiling_grid, omnibus_test, clean_change_map
\ No newline at end of file
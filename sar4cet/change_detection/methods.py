@@ -1,9 +1,12 @@
 import numpy as np
-from scipy.stats import chi2
 import rasterio
+from rasterio.windows import Window
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from scipy import ndimage
 import os
 
-def detect_changes(images, method='omnibus', significance=0.01):
+def detect_changes(images, method='omnibus', significance=0.01, backend='numpy'):
     """
     Detect changes in a time series of SAR images.
     
@@ -16,6 +19,9 @@ def detect_changes(images, method='omnibus', significance=0.01):
         Options: 'omnibus', 'ratio', 'difference'
     significance : float, optional
         Significance level for statistical tests, by default 0.01
+    backend : str, optional
+        Array backend to compute with, by default 'numpy'
+        Options: 'numpy', 'cupy' (GPU, omnibus method only; requires CuPy)
     
     Returns
     -------
@@ -24,32 +30,45 @@ def detect_changes(images, method='omnibus', significance=0.01):
     """
     # Load images if file paths are provided
     if isinstance(images[0], str):
-        loaded_images = []
-        metadata = None
-        
-        for img_path in images:
-            with rasterio.open(img_path) as src:
-                img_data = src.read(1)  # Read first band
-                if metadata is None:
-                    metadata = src.meta
-                loaded_images.append(img_data)
+        with rasterio.open(images[0]) as src:
+            metadata = src.meta
         
-        images = loaded_images
+        # Read the first band of each image straight into its slice of a
+        # pre-allocated float32 3D array (time, height, width). GDAL releases
+        # the GIL while reading, so the files are read concurrently
+        image_stack = np.empty((len(images), metadata['height'], metadata['width']), dtype=np.float32)
+        with ThreadPoolExecutor(max_workers=min(8, len(images))) as executor:
+            list(executor.map(_read_first_band, images, image_stack))
     else:
         metadata = None
+        
+        # Convert list of images to 3D array (time, height, width), without
+        # copying if a 3D array is given
+        if isinstance(images, np.ndarray):
+            image_stack = images
+        else:
+            image_stack = np.stack(images, axis=0)
     
-    # Convert list of images to 3D array (time, height, width)
-    image_stack = np.stack(images, axis=0)
+    # float32 is ample for SAR backscatter and halves the memory traffic of
+    # every method (no copy if the stack already is float32)
+    image_stack = image_stack.astype(np.float32, copy=False)
     
     # Apply selected change detection method
-    if method == 'omnibus':
-        changes = omnibus_test(image_stack, significance)
-    elif method == 'ratio':
-        changes = ratio_test(image_stack)
-    elif method == 'difference':
-        changes = difference_test(image_stack)
+    if backend == 'numpy':
+        changes = _apply_method(image_stack, method, significance)
+    elif backend == 'cupy':
+        if method != 'omnibus':
+            raise ValueError(f"The cupy backend only supports the omnibus method, got {method}")
+        try:
+            import cupy
+        except ImportError:
+            raise ImportError("The cupy backend requires CuPy to be installed") from None
+        
+        # Run the test on the GPU and copy the change maps back
+        changes = omnibus_test(cupy.asarray(image_stack), significance)
+        changes = {key: cupy.asnumpy(change_map) for key, change_map in changes.items()}
     else:
-        raise ValueError(f"Unknown method: {method}")
+        raise ValueError(f"Unknown backend: {backend}")
     
     return {
         'first_change': changes['first_change'],
@@ -58,6 +77,190 @@ def detect_changes(images, method='omnibus', significance=0.01):
         'metadata': metadata
     }
 
+def detect_changes_windowed(image_paths, method='omnibus', significance=0.01, tile_size=512, n_workers=1):
+    """
+    Detect changes in a time series of SAR images, processing them tile by tile.
+    
+    All change detection methods work per pixel, so the rasters are read
+    window by window and only a (time, tile_size, tile_size) stack is held
+    in memory at once. This allows scenes larger than the available memory.
+    
+    Parameters
+    ----------
+    image_paths : list
+        List of image file paths, all on the same grid
+    method : str, optional
+        Change detection method to use, by default 'omnibus'
+        Options: 'omnibus', 'ratio', 'difference'
+    significance : float, optional
+        Significance level for statistical tests, by default 0.01
+    tile_size : int, optional
+        Size of the square tiles in pixels, by default 512. Rounded up to a
+        multiple of the internal block size for tiled rasters.
+    n_workers : int or None, optional
+        Number of processes used to work on tiles in parallel, by default 1
+        (serial). None uses all available CPUs.
+    
+    Returns
+    -------
+    dict
+        Dictionary containing change maps and metadata
+    """
+    with rasterio.open(image_paths[0]) as src:
+        metadata = src.meta
+        rows, cols = src.height, src.width
+        block_rows, block_cols = src.block_shapes[0]
+    
+    # For internally tiled rasters, round the tile size up to a multiple of
+    # the block size so every window decodes whole blocks only
+    if block_rows == block_cols and block_rows < rows:
+        tile_size = -(-tile_size // block_rows) * block_rows
+    
+    # Initialize output arrays
+    change_maps = {
+        'first_change': np.zeros((rows, cols), dtype=np.uint8),
+        'change_frequency': np.zeros((rows, cols), dtype=np.uint8),
+        'change_magnitude': np.zeros((rows, cols), dtype=np.float32)
+    }
+    
+    windows = generate_tiling_grid((rows, cols), tile_size)
+    
+    if n_workers is None or n_workers > 1:
+        # Dataset handles cannot be shared between processes, so each worker
+        # opens the rasters itself; tiles are stored as they complete
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_process_tile, image_paths, window, method, significance) for window in windows]
+            for future in as_completed(futures):
+                window, changes = future.result()
+                _store_tile(change_maps, window, changes)
+    else:
+        with rasterio.Env(GDAL_CACHEMAX=512, GDAL_NUM_THREADS='ALL_CPUS', VSI_CACHE=True), ExitStack() as stack:
+            # Keep every raster open for the whole tile loop
+            sources = [stack.enter_context(rasterio.open(img_path)) for img_path in image_paths]
+            
+            for window in windows:
+                changes = _apply_method(_read_tile(sources, window), method, significance)
+                _store_tile(change_maps, window, changes)
+    
+    change_maps['metadata'] = metadata
+    return change_maps
+
+def generate_tiling_grid(shape, tile, overlap=0):
+    """
+    Generate a grid of windows covering a raster.
+    
+    Parameters
+    ----------
+    shape : tuple
+        Raster shape (height, width)
+    tile : int
+        Size of the square tiles in pixels
+    overlap : int, optional
+        Number of pixels shared by neighbouring tiles, by default 0
+    
+    Returns
+    -------
+    list
+        List of rasterio.windows.Window objects, clipped to the raster
+    """
+    if not 0 <= overlap < tile:
+        raise ValueError(f"Overlap must be between 0 and tile - 1, got {overlap}")
+    
+    rows, cols = shape
+    step = tile - overlap
+    
+    windows = []
+    for row_off in range(0, rows, step):
+        for col_off in range(0, cols, step):
+            windows.append(Window(col_off, row_off, min(tile, cols - col_off), min(tile, rows - row_off)))
+            
+            # The last tile already reaches the raster edge
+            if col_off + tile >= cols:
+                break
+        if row_off + tile >= rows:
+            break
+    
+    return windows
+
+def clean_change_map(mask, radius=1):
+    """
+    Remove isolated, speckle-induced changes from a change map.
+    
+    Applies a morphological opening with a disk-shaped structuring element.
+    
+    Parameters
+    ----------
+    mask : numpy.ndarray
+        2D change map, e.g. first_change or change_frequency; non-zero
+        pixels are changes
+    radius : int, optional
+        Radius of the structuring element in pixels, by default 1
+    
+    Returns
+    -------
+    numpy.ndarray
+        Boolean change mask with changes smaller than the disk removed
+    """
+    # Disk-shaped footprint
+    y, x = np.ogrid[-radius:radius + 1, -radius:radius + 1]
+    footprint = x * x + y * y <= radius * radius
+    mask = np.asarray(mask).astype(bool)
+    
+    # Opening; pixels outside the scene count as changed during the erosion,
+    # so changes touching the scene edge are kept
+    eroded = ndimage.binary_erosion(mask, footprint, border_value=1)
+    
+    return ndimage.binary_dilation(eroded, footprint)
+
+def _read_first_band(img_path, out):
+    """
+    Read the first band of a raster into a pre-allocated array.
+    """
+    # rasterio environments are per thread, so each read sets up its own
+    with rasterio.Env(GDAL_CACHEMAX=512, VSI_CACHE=True), rasterio.open(img_path) as src:
+        src.read(1, out=out)
+
+def _read_tile(sources, window):
+    """
+    Read the same window of every open raster into a (time, height, width) stack.
+    """
+    tile_stack = np.empty((len(sources), window.height, window.width), dtype=np.float32)
+    for t, src in enumerate(sources):
+        src.read(1, window=window, out=tile_stack[t])
+    
+    return tile_stack
+
+def _process_tile(image_paths, window, method, significance):
+    """
+    Read and process one tile in a worker process.
+    """
+    with rasterio.Env(GDAL_CACHEMAX=512, VSI_CACHE=True), ExitStack() as stack:
+        sources = [stack.enter_context(rasterio.open(img_path)) for img_path in image_paths]
+        tile_stack = _read_tile(sources, window)
+    
+    return window, _apply_method(tile_stack, method, significance)
+
+def _store_tile(change_maps, window, changes):
+    """
+    Copy the change maps of one tile into the full-size change maps.
+    """
+    row_slice, col_slice = window.toslices()
+    for key, change_map in change_maps.items():
+        change_map[row_slice, col_slice] = changes[key]
+
+def _apply_method(image_stack, method, significance):
+    """
+    Apply the selected change detection method to an image stack.
+    """
+    if method == 'omnibus':
+        return omnibus_test(image_stack, significance)
+    elif method == 'ratio':
+        return ratio_test(image_stack)
+    elif method == 'difference':
+        return difference_test(image_stack)
+    else:
+        raise ValueError(f"Unknown method: {method}")
+
 def omnibus_test(image_stack, significance=0.01):
     """
     Apply the omnibus test for change detection in a time series of SAR images.
@@ -65,8 +268,9 @@ def omnibus_test(image_stack, significance=0.01):
     
     Parameters
     ----------
-    image_stack : numpy.ndarray
-        3D array of images (time, height, width)
+    image_stack : numpy.ndarray or cupy.ndarray
+        3D array of images (time, height, width). CuPy arrays are processed
+        on the GPU.
     significance : float, optional
         Significance level for the test, by default 0.01
     
@@ -78,46 +282,51 @@ def omnibus_test(image_stack, significance=0.01):
     k = image_stack.shape[0]  # Number of images
     rows, cols = image_stack.shape[1], image_stack.shape[2]
     
-    # Initialize output arrays
-    first_change = np.zeros((rows, cols), dtype=np.uint8)
-    change_frequency = np.zeros((rows, cols), dtype=np.uint8)
-    change_magnitude = np.zeros((rows, cols), dtype=np.float32)
+    # Array module matching the input (numpy or cupy)
+    xp = _array_module(image_stack)
+    
+    # No change can be detected without at least two images
+    if k < 2:
+        return {
+            'first_change': xp.zeros((rows, cols), dtype=np.uint8),
+            'change_frequency': xp.zeros((rows, cols), dtype=np.uint8),
+            'change_magnitude': xp.zeros((rows, cols), dtype=np.float32)
+        }
     
     # Number of looks (assumed to be 5 for Sentinel-1 GRD)
     n_looks = 5
     
-    # Critical value based on significance level
-    critical_value = chi2.ppf(1 - significance, 2)
+    # Critical value based on significance level. The chi-squared quantile
+    # with 2 degrees of freedom has the closed form -2 * log(significance)
+    critical_value = -2 * np.log(significance)
     
-    # Compute omnibus test statistic for each pixel
-    for i in range(1, k):
-        # Subset of images up to current time
-        subset = image_stack[:i+1]
-        
-        # Compute mean of all images
-        mean_all = np.mean(subset, axis=0)
-        
-        # Compute mean of previous images
-        mean_prev = np.mean(subset[:-1], axis=0)
-        
-        # Compute ratio of means
-        ratio = mean_all / mean_prev
-        
-        # Compute test statistic
-        test_statistic = -2 * n_looks * np.log(ratio)
-        
-        # Identify changes
-        changes = test_statistic > critical_value
-        
-        # Update first change map
-        mask = (first_change == 0) & changes
-        first_change[mask] = i
-        
-        # Update change frequency map
-        change_frequency[changes] += 1
-        
-        # Update change magnitude map
-        change_magnitude[changes] = np.maximum(change_magnitude[changes], test_statistic[changes])
+    # Cumulative sums give the means up to every time step in one pass, so
+    # all k - 1 tests are evaluated at once instead of in a loop (in float32,
+    # like the rest of the change detection)
+    cumulative_sum = xp.cumsum(image_stack, axis=0, dtype=np.float32)
+    steps = xp.arange(1, k, dtype=np.float32)[:, None, None]
+    
+    # Compute ratio of the mean of all images up to each time step to the
+    # mean of the previous images, (S[i] / (i + 1)) / (S[i-1] / i), in a
+    # single buffer without materializing the means
+    ratio = cumulative_sum[1:] / cumulative_sum[:-1]
+    ratio *= steps / (steps + 1)
+    
+    # Compute test statistic
+    test_statistic = xp.log(ratio, out=ratio)
+    test_statistic *= -2 * n_looks
+    
+    # Identify changes
+    changes = test_statistic > critical_value
+    
+    # First change map (time index of the first detected change, 0 if none)
+    first_change = _first_change(changes)
+    
+    # Change frequency map
+    change_frequency = changes.sum(axis=0, dtype=np.uint8)
+    
+    # Change magnitude map (largest significant test statistic)
+    change_magnitude = xp.where(changes, test_statistic, 0).max(axis=0).astype(np.float32)
     
     return {
         'first_change': first_change,
@@ -142,32 +351,41 @@ def ratio_test(image_stack):
     k = image_stack.shape[0]  # Number of images
     rows, cols = image_stack.shape[1], image_stack.shape[2]
     
-    # Initialize output arrays
-    first_change = np.zeros((rows, cols), dtype=np.uint8)
-    change_frequency = np.zeros((rows, cols), dtype=np.uint8)
+    # Natural log of the stack, so that ratios become differences
+    log_stack = _log_stack(image_stack)
+    
+    # Initialize output arrays, with one change mask per time step
+    changes = np.zeros((k - 1, rows, cols), dtype=bool)
     change_magnitude = np.zeros((rows, cols), dtype=np.float32)
     
     # Threshold for ratio test (can be adjusted)
     threshold = 1.5
+    log_threshold = np.float32(np.log(threshold))
+    
+    # Scratch buffers reused at every time step
+    valid = np.empty((rows, cols), dtype=bool)
+    log_ratio = np.empty((rows, cols), dtype=np.float32)
     
     # Compute ratio between consecutive images
     for i in range(1, k):
-        # Compute ratio
-        ratio = image_stack[i] / (image_stack[i-1] + 1e-10)  # Add small value to avoid division by zero
+        # Absolute log ratio, used both for the test and as the magnitude
+        np.subtract(log_stack[i], log_stack[i-1], out=log_ratio)
+        np.abs(log_ratio, out=log_ratio)
         
-        # Identify changes (ratio > threshold or ratio < 1/threshold)
-        changes = (ratio > threshold) | (ratio < 1/threshold)
-        
-        # Update first change map
-        mask = (first_change == 0) & changes
-        first_change[mask] = i
-        
-        # Update change frequency map
-        change_frequency[changes] += 1
+        # Identify changes (ratio > threshold or ratio < 1/threshold, i.e.
+        # |log ratio| > log threshold). Pixels whose previous value is zero
+        # (e.g. no-data at scene edges) have no defined ratio and are treated
+        # as unchanged
+        np.greater(log_ratio, log_threshold, out=changes[i-1])
+        np.greater(image_stack[i-1], 0, out=valid)
+        changes[i-1] &= valid
         
         # Update change magnitude map (using log ratio as magnitude)
-        log_ratio = np.abs(np.log(ratio))
-        change_magnitude[changes] = np.maximum(change_magnitude[changes], log_ratio[changes])
+        np.maximum(change_magnitude, log_ratio, out=change_magnitude, where=changes[i-1])
+    
+    # Derive first change and change frequency maps from all steps at once
+    first_change = _first_change(changes)
+    change_frequency = changes.sum(axis=0, dtype=np.uint8)
     
     return {
         'first_change': first_change,
@@ -192,37 +410,74 @@ def difference_test(image_stack):
     k = image_stack.shape[0]  # Number of images
     rows, cols = image_stack.shape[1], image_stack.shape[2]
     
-    # Initialize output arrays
-    first_change = np.zeros((rows, cols), dtype=np.uint8)
-    change_frequency = np.zeros((rows, cols), dtype=np.uint8)
-    change_magnitude = np.zeros((rows, cols), dtype=np.float32)
+    # Natural log of the stack, so that ratios become differences
+    log_stack = _log_stack(image_stack)
     
-    # Convert to dB scale
-    image_stack_db = 10 * np.log10(image_stack + 1e-10)
+    # Initialize output arrays, with one change mask per time step
+    changes = np.zeros((k - 1, rows, cols), dtype=bool)
+    change_magnitude = np.zeros((rows, cols), dtype=np.float32)
     
     # Threshold for difference test in dB (can be adjusted)
     threshold = 3.0  # 3 dB change
     
-    # Compute difference between consecutive images
+    # Scale from natural log to dB (10 * log10(x) = 10 / ln(10) * ln(x))
+    db_scale = np.float32(10 / np.log(10))
+    
+    # Scratch buffer reused for the difference at every time step
+    diff = np.empty((rows, cols), dtype=np.float32)
+    
+    # Compute difference between consecutive images in dB
     for i in range(1, k):
         # Compute difference
-        diff = np.abs(image_stack_db[i] - image_stack_db[i-1])
+        np.subtract(log_stack[i], log_stack[i-1], out=diff)
+        np.abs(diff, out=diff)
+        diff *= db_scale
         
         # Identify changes
-        changes = diff > threshold
-        
-        # Update first change map
-        mask = (first_change == 0) & changes
-        first_change[mask] = i
-        
-        # Update change frequency map
-        change_frequency[changes] += 1
+        np.greater(diff, threshold, out=changes[i-1])
         
         # Update change magnitude map
-        change_magnitude[changes] = np.maximum(change_magnitude[changes], diff[changes])
+        np.maximum(change_magnitude, diff, out=change_magnitude, where=changes[i-1])
+    
+    # Derive first change and change frequency maps from all steps at once
+    first_change = _first_change(changes)
+    change_frequency = changes.sum(axis=0, dtype=np.uint8)
     
     return {
         'first_change': first_change,
         'change_frequency': change_frequency,
         'change_magnitude': change_magnitude
-    }
\ No newline at end of file
+    }
+
+def _log_stack(image_stack):
+    """
+    Natural log of an image stack as float32, computed in place in one
+    buffer. A small value is added to avoid the log of zero.
+    """
+    log_stack = np.empty(image_stack.shape, dtype=np.float32)
+    np.add(image_stack, 1e-10, out=log_stack)
+    np.log(log_stack, out=log_stack)
+    
+    return log_stack
+
+def _first_change(changes):
+    """
+    Time index of the first change of each pixel (0 if none), from a
+    (time - 1, height, width) stack of per-step change masks.
+    """
+    xp = _array_module(changes)
+    if len(changes) == 0:
+        return xp.zeros(changes.shape[1:], dtype=np.uint8)
+    
+    # argmax on a boolean stack returns the index of the first True
+    return xp.where(changes.any(axis=0), changes.argmax(axis=0) + 1, 0).astype(np.uint8)
+
+def _array_module(array):
+    """
+    Return the array module of an array: cupy for GPU arrays, numpy otherwise.
+    """
+    if type(array).__module__.startswith('cupy'):
+        import cupy
+        return cupy
+    
+    return np
@@ -1,12 +1,12 @@
 import numpy as np
 import rasterio
 import cv2
-from scipy import ndimage
 from sklearn.ensemble import IsolationForest
 from sklearn.cluster import DBSCAN
-from sklearn.decomposition import PCA
+from sklearn.metrics.pairwise import euclidean_distances
 import matplotlib.pyplot as plt
 from datetime import datetime
+from ..utils.io import read_image_series
 
 def detect_anomalies(image_series, timestamps=None, roi=None, method='isolation_forest'):
     """
@@ -27,41 +27,34 @@ def detect_anomalies(image_series, timestamps=None, roi=None, method='isolation_
     Returns
     -------
     dict
-        Dictionary containing anomaly detection results
+        Dictionary containing anomaly detection results (the temporal mean and
+        standard deviation images are only computed for the 'threshold' method,
+        and are None otherwise)
     """
-    # Load images if file paths are provided
-    loaded_images = []
+    # Get metadata from first image
     transform = None
     crs = None
     
-    for i, image in enumerate(image_series):
-        if isinstance(image, str):
-            with rasterio.open(image) as src:
-                img_data = src.read(1)  # Read first band
-                if i == 0:  # Get metadata from first image
-                    transform = src.transform
-                    crs = src.crs
-        else:
-            img_data = image
-        
-        # Apply ROI if provided
-        if roi is not None:
-            row_start, row_end, col_start, col_end = roi
-            img_data = img_data[row_start:row_end, col_start:col_end]
-        
-        loaded_images.append(img_data)
+    if len(image_series) > 0 and isinstance(image_series[0], str):
+        with rasterio.open(image_series[0]) as src:
+            transform = src.transform
+            crs = src.crs
+    
+    # Load images if file paths are provided
+    loaded_images = read_image_series(image_series, roi)
     
     # Create timestamps if not provided
     if timestamps is None:
         base_time = datetime.now()
         timestamps = [base_time - datetime.timedelta(days=i) for i in range(len(loaded_images)-1, -1, -1)]
     
-    # Convert list of images to 3D array (time, height, width)
-    image_stack = np.stack(loaded_images, axis=0)
+    # Convert list of images to 3D array (time, height, width), in single
+    # precision to halve the memory traffic of the detectors
+    image_stack = np.stack(loaded_images, axis=0).astype(np.float32, copy=False)
     
-    # Compute temporal statistics
-    mean_image = np.mean(image_stack, axis=0)
-    std_image = np.std(image_stack, axis=0)
+    # Temporal statistics are only needed by the threshold method
+    mean_image = None
+    std_image = None
     
     # Detect anomalies based on selected method
     if method == 'isolation_forest':
@@ -69,6 +62,8 @@ def detect_anomalies(image_series, timestamps=None, roi=None, method='isolation_
     elif method == 'dbscan':
         anomalies = _dbscan_anomalies(image_stack, timestamps)
     elif method == 'threshold':
+        mean_image = np.mean(image_stack, axis=0)
+        std_image = np.std(image_stack, axis=0)
         anomalies = _threshold_anomalies(image_stack, timestamps, mean_image, std_image)
     else:
         raise ValueError(f"Unknown method: {method}")
@@ -81,7 +76,7 @@ def detect_anomalies(image_series, timestamps=None, roi=None, method='isolation_
         'crs': crs
     }
 
-def _isolation_forest_anomalies(image_stack, timestamps):
+def _isolation_forest_anomalies(image_stack, timestamps, downsample=4):
     """
     Detect anomalies using Isolation Forest algorithm.
     
@@ -91,35 +86,47 @@ def _isolation_forest_anomalies(image_stack, timestamps):
         3D array of images (time, height, width)
     timestamps : list
         List of datetime objects
+    downsample : int, optional
+        Factor by which large images are block-averaged before fitting, by default 4
     
     Returns
     -------
     list
         List of detected anomalies
     """
-    # Reshape image stack for anomaly detection
     n_times, height, width = image_stack.shape
+    
+    # Image-level anomalies show at coarse scales, so block-average large
+    # images before fitting
+    if downsample > 1 and height * width > 1000:
+        size = (max(1, width // downsample), max(1, height // downsample))
+        image_stack = np.stack([cv2.resize(image, size, interpolation=cv2.INTER_AREA) for image in image_stack])
+        n_times, height, width = image_stack.shape
+    
+    # Reshape image stack for anomaly detection
     X = image_stack.reshape(n_times, height * width)
     
-    # Apply PCA to reduce dimensionality if the data is too large
+    # Apply PCA to reduce dimensionality if the data is too large (centered
+    # data has at most n_times - 1 components)
     if X.shape[1] > 1000:
-        pca = PCA(n_components=min(100, n_times))
-        X_pca = pca.fit_transform(X)
+        X_pca = _pca_scores(X, max(1, min(100, n_times - 1)))
     else:
         X_pca = X
     
-    # Apply Isolation Forest
-    clf = IsolationForest(contamination=0.1, random_state=42)
-    y_pred = clf.fit_predict(X_pca)
+    # Apply Isolation Forest, building the trees on all cores (each tree
+    # sub-samples at most 256 images)
+    clf = IsolationForest(contamination=0.1, max_samples=min(256, n_times), n_jobs=-1, random_state=42)
+    clf.fit(X_pca)
     
-    # Find anomalous images (y_pred == -1)
-    anomaly_indices = np.where(y_pred == -1)[0]
+    # Score all images in one call (negative of decision function, higher =
+    # more anomalous); images with a negative decision function are anomalous
+    scores = -clf.decision_function(X_pca)
+    anomaly_indices = np.where(scores > 0)[0]
     
     # Create list of anomalies
     anomalies = []
     for idx in anomaly_indices:
-        # Calculate anomaly score (negative of decision function, higher = more anomalous)
-        score = -clf.decision_function(X_pca[idx].reshape(1, -1))[0]
+        score = scores[idx]
         
         # Create anomaly object
         anomaly = {
@@ -155,30 +162,33 @@ def _dbscan_anomalies(image_stack, timestamps):
     n_times, height, width = image_stack.shape
     X = image_stack.reshape(n_times, height * width)
     
-    # Apply PCA to reduce dimensionality
-    pca = PCA(n_components=min(20, n_times))
-    X_pca = pca.fit_transform(X)
+    # Apply PCA to reduce dimensionality (centered data has at most
+    # n_times - 1 components)
+    X_pca = _pca_scores(X, max(1, min(20, n_times - 1)))
+    
+    # Pairwise distances between the (few) images, shared by DBSCAN and the
+    # anomaly scores below
+    distances = euclidean_distances(X_pca)
     
     # Apply DBSCAN
-    clustering = DBSCAN(eps=3, min_samples=2).fit(X_pca)
+    clustering = DBSCAN(eps=3, min_samples=2, metric='precomputed').fit(distances)
     labels = clustering.labels_
     
     # Find anomalous images (label == -1)
     anomaly_indices = np.where(labels == -1)[0]
     
+    # Calculate distance to nearest cluster as anomaly score. The nearest
+    # cluster contains the nearest non-noise point, so it is the smallest
+    # distance to any clustered image
+    clustered = labels != -1
+    if np.any(clustered):
+        scores = distances[np.ix_(anomaly_indices, clustered)].min(axis=1)
+    else:
+        scores = np.ones(len(anomaly_indices))
+    
     # Create list of anomalies
     anomalies = []
-    for idx in anomaly_indices:
-        # Calculate distance to nearest cluster as anomaly score
-        distances = []
-        for label in set(labels):
-            if label != -1:  # Skip noise points
-                cluster_points = X_pca[labels == label]
-                dist = np.min(np.linalg.norm(X_pca[idx] - cluster_points, axis=1))
-                distances.append(dist)
-        
-        score = min(distances) if distances else 1.0
-        
+    for idx, score in zip(anomaly_indices, scores):
         # Create anomaly object
         anomaly = {
             'timestamp': timestamps[idx],
@@ -193,6 +203,24 @@ def _dbscan_anomalies(image_stack, timestamps):
     
     return anomalies
 
+def _pca_scores(X, n_components):
+    """
+    Principal component scores of the rows of X.
+    
+    There are far fewer images than pixels, so the scores are taken from the
+    eigendecomposition of the small n_samples x n_samples Gram matrix rather
+    than from an SVD of the full data.
+    """
+    X_centered = X - X.mean(axis=0)
+    gram = X_centered @ X_centered.T
+    eigenvalues, eigenvectors = np.linalg.eigh(gram)
+    
+    # eigh returns eigenvalues in ascending order; keep the largest
+    eigenvalues = eigenvalues[::-1][:n_components]
+    eigenvectors = eigenvectors[:, ::-1][:, :n_components]
+    
+    return eigenvectors * np.sqrt(np.maximum(eigenvalues, 0))
+
 def _threshold_anomalies(image_stack, timestamps, mean_image, std_image, threshold=3.0):
     """
     Detect anomalies using threshold-based method.
@@ -215,13 +243,18 @@ def _threshold_anomalies(image_stack, timestamps, mean_image, std_image, thresho
     list
         List of detected anomalies
     """
-    # Calculate z-scores for each image
-    z_scores = np.zeros_like(image_stack)
-    for i in range(image_stack.shape[0]):
-        z_scores[i] = np.abs((image_stack[i] - mean_image) / (std_image + 1e-10))  # Avoid division by zero
+    # Reciprocal of the standard deviation, computed once
+    inv_std = 1.0 / (std_image + 1e-10)  # Avoid division by zero
     
-    # Calculate mean z-score for each image
-    mean_z_scores = np.mean(z_scores, axis=(1, 2))
+    # Calculate mean z-score for each image, through one reused scratch
+    # buffer rather than a full (time, height, width) z-score cube
+    z_scores = np.empty(image_stack.shape[1:], dtype=np.result_type(image_stack, inv_std))
+    mean_z_scores = np.empty(image_stack.shape[0], dtype=z_scores.dtype)
+    for i in range(image_stack.shape[0]):
+        np.subtract(image_stack[i], mean_image, out=z_scores)
+        np.abs(z_scores, out=z_scores)
+        z_scores *= inv_std
+        mean_z_scores[i] = z_scores.mean()
     
     # Find anomalous images (mean z-score > threshold)
     anomaly_indices = np.where(mean_z_scores > threshold)[0]
@@ -262,24 +295,15 @@ def classify_anomalies(image_series, anomalies, roi=None):
         Dictionary containing classified anomalies
     """
     # Load images if file paths are provided
-    loaded_images = []
+    loaded_images = read_image_series(image_series, roi)
     
-    for image in image_series:
-        if isinstance(image, str):
-            with rasterio.open(image) as src:
-                img_data = src.read(1)  # Read first band
-        else:
-            img_data = image
-        
-        # Apply ROI if provided
-        if roi is not None:
-            row_start, row_end, col_start, col_end = roi
-            img_data = img_data[row_start:row_end, col_start:col_end]
-        
-        loaded_images.append(img_data)
+    # Convert list of images to 3D array (time, height, width), in single
+    # precision to halve the memory traffic of the detectors
+    image_stack = np.stack(loaded_images, axis=0).astype(np.float32, copy=False)
     
-    # Convert list of images to 3D array (time, height, width)
-    image_stack = np.stack(loaded_images, axis=0)
+    # Statistics of the whole stack, shared by all anomalies
+    mean_all = np.mean(image_stack)
+    std_all = np.std(image_stack)
     
     # Classify each anomaly
     classified_anomalies = []
@@ -287,8 +311,12 @@ def classify_anomalies(image_series, anomalies, roi=None):
         idx = anomaly['index']
         anomaly_image = image_stack[idx]
         
+        # Neighbouring images, if any
+        prev_image = image_stack[idx - 1] if idx > 0 else None
+        next_image = image_stack[idx + 1] if idx < image_stack.shape[0] - 1 else None
+        
         # Extract features for classification
-        features = _extract_anomaly_features(anomaly_image, image_stack, idx)
+        features = _extract_anomaly_features(anomaly_image, prev_image, next_image, mean_all, std_all)
         
         # Classify anomaly based on features
         anomaly_type = _classify_based_on_features(features)
@@ -313,7 +341,7 @@ def classify_anomalies(image_series, anomalies, roi=None):
         'anomaly_types': anomaly_types
     }
 
-def _extract_anomaly_features(anomaly_image, image_stack, idx):
+def _extract_anomaly_features(anomaly_image, prev_image, next_image, mean_all, std_all):
     """
     Extract features for anomaly classification.
     
@@ -321,10 +349,14 @@ def _extract_anomaly_features(anomaly_image, image_stack, idx):
     ----------
     anomaly_image : numpy.ndarray
         Anomalous image
-    image_stack : numpy.ndarray
-        3D array of images (time, height, width)
-    idx : int
-        Index of anomaly in image stack
+    prev_image : numpy.ndarray or None
+        Image before the anomaly, None for the first image
+    next_image : numpy.ndarray or None
+        Image after the anomaly, None for the last image
+    mean_all : float
+        Mean of the whole image stack
+    std_all : float
+        Standard deviation of the whole image stack
     
     Returns
     -------
@@ -332,14 +364,12 @@ def _extract_anomaly_features(anomaly_image, image_stack, idx):
         Dictionary of features
     """
     # Calculate temporal difference
-    if idx > 0:
-        prev_image = image_stack[idx - 1]
+    if prev_image is not None:
         diff_prev = anomaly_image - prev_image
     else:
         diff_prev = np.zeros_like(anomaly_image)
     
-    if idx < image_stack.shape[0] - 1:
-        next_image = image_stack[idx + 1]
+    if next_image is not None:
         diff_next = anomaly_image - next_image
     else:
         diff_next = np.zeros_like(anomaly_image)
@@ -350,10 +380,12 @@ def _extract_anomaly_features(anomaly_image, image_stack, idx):
     max_value = np.max(anomaly_image)
     min_value = np.min(anomaly_image)
     
-    # Calculate gradient magnitude
-    grad_x = ndimage.sobel(anomaly_image, axis=1)
-    grad_y = ndimage.sobel(anomaly_image, axis=0)
-    gradient_magnitude = np.sqrt(grad_x**2 + grad_y**2)
+    # Calculate gradient magnitude (OpenCV's Sobel with the same edge
+    # handling as scipy's, and a fused magnitude)
+    image_32 = anomaly_image.astype(np.float32, copy=False)
+    grad_x = cv2.Sobel(image_32, cv2.CV_32F, 1, 0, ksize=3, borderType=cv2.BORDER_REFLECT)
+    grad_y = cv2.Sobel(image_32, cv2.CV_32F, 0, 1, ksize=3, borderType=cv2.BORDER_REFLECT)
+    gradient_magnitude = cv2.magnitude(grad_x, grad_y)
     mean_gradient = np.mean(gradient_magnitude)
     
     # Calculate texture features (GLCM)
@@ -361,10 +393,8 @@ def _extract_anomaly_features(anomaly_image, image_stack, idx):
     texture = std_value
     
     # Calculate bright and dark spot counts
-    mean_all = np.mean(image_stack)
-    std_all = np.std(image_stack)
-    bright_spots = np.sum(anomaly_image > (mean_all + 2 * std_all))
-    dark_spots = np.sum(anomaly_image < (mean_all - 2 * std_all))
+    bright_spots = np.count_nonzero(anomaly_image > (mean_all + 2 * std_all))
+    dark_spots = np.count_nonzero(anomaly_image < (mean_all - 2 * std_all))
     
     return {
         'mean_value': mean_value,
@@ -428,14 +458,7 @@ def visualize_anomalies(image_series, anomalies, output_file=None, figsize=(15,
         Figure object
     """
     # Load images if file paths are provided
-    loaded_images = []
-    for image in image_series:
-        if isinstance(image, str):
-            with rasterio.open(image) as src:
-                img_data = src.read(1)  # Read first band
-        else:
-            img_data = image
-        loaded_images.append(img_data)
+    loaded_images = read_image_series(image_series)
     
     # Get classified anomalies
     classified_anomalies = anomalies['classified_anomalies']
@@ -448,6 +471,12 @@ def visualize_anomalies(image_series, anomalies, output_file=None, figsize=(15,
     if n_anomalies == 1:
         axes = axes.reshape(2, 1)
     
+    # Display range of every shown image, taken once per image (without
+    # copying the images into a stack)
+    shown_images = [loaded_images[anomaly['index']] for anomaly in classified_anomalies[:n_anomalies]]
+    image_mins = [img.min() for img in shown_images]
+    image_maxs = [img.max() for img in shown_images]
+    
     # Plot each anomaly
     for i in range(n_anomalies):
         anomaly = classified_anomalies[i]
@@ -460,7 +489,7 @@ def visualize_anomalies(image_series, anomalies, output_file=None, figsize=(15,
         anomaly_image = loaded_images[idx]
         
         # Normalize for display
-        img_norm = (anomaly_image - np.min(anomaly_image)) / (np.max(anomaly_image) - np.min(anomaly_image))
+        img_norm = (anomaly_image - image_mins[i]) / (image_maxs[i] - image_mins[i])
         
         # Plot anomaly image
         axes[0, i].imshow(img_norm, cmap='viridis')
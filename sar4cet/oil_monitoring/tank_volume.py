@@ -1,7 +1,7 @@
 import numpy as np
 import rasterio
 import cv2
-from scipy import ndimage
+from scipy.spatial import cKDTree
 from skimage import feature, measure, segmentation
 import matplotlib.pyplot as plt
 
@@ -25,7 +25,8 @@ def estimate_tank_volume(image, dem=None, min_diameter=10, max_diameter=100, thr
     Returns
     -------
     dict
-        Dictionary containing tank locations, dimensions, and volume estimates
+        Dictionary containing tank locations, dimensions, and volume estimates,
+        both per tank and as 'centroids', 'diameters' and 'volumes' arrays
     """
     # Load image if file path is provided
     if isinstance(image, str):
@@ -38,92 +39,104 @@ def estimate_tank_volume(image, dem=None, min_diameter=10, max_diameter=100, thr
         transform = None
         crs = None
     
-    # Normalize image
-    img_norm = (img_data - np.min(img_data)) / (np.max(img_data) - np.min(img_data))
+    # Apply adaptive thresholding to identify potential tank regions; the
+    # threshold is relative to the image range, so compare against it in
+    # image units rather than normalizing the whole image
+    img_min, img_max = img_data.min(), img_data.max()
+    binary = img_data > img_min + threshold * (img_max - img_min)
     
-    # Apply adaptive thresholding to identify potential tank regions
-    binary = img_norm > threshold
+    # Remove small objects (zero border, as in ndimage.binary_opening)
+    binary = cv2.morphologyEx(binary.astype(np.uint8), cv2.MORPH_OPEN, np.ones((3, 3), np.uint8),
+                              borderType=cv2.BORDER_CONSTANT, borderValue=0)
     
-    # Remove small objects
-    binary = ndimage.binary_opening(binary, structure=np.ones((3, 3)))
+    # Label connected components, with their bounding boxes, areas and centroids
+    num_labels, labeled, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=4)
     
-    # Label connected components
-    labeled, num_features = ndimage.label(binary)
+    # Extract properties of detected regions and filter them on size; the
+    # perimeter is only computed for regions that pass the size filter
+    regions = measure.regionprops(labeled)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    diameters = np.sqrt(4 * areas / np.pi)
+    candidates = np.flatnonzero((min_diameter <= diameters) & (diameters <= max_diameter))
     
-    # Extract properties of detected regions
-    regions = measure.regionprops(labeled, img_data)
+    # Load the DEM once for all tanks if a file path is provided
+    if isinstance(dem, str):
+        with rasterio.open(dem) as src:
+            dem_data = src.read(1)
+    else:
+        dem_data = dem
+    
+    # Calculate circularity of the candidates, all at once
+    perimeters = np.array([regions[i].perimeter for i in candidates], dtype=float)
+    circularities = np.zeros(len(candidates))
+    np.divide(4 * np.pi * areas[candidates], perimeters * perimeters, out=circularities, where=perimeters > 0)
+    
+    # Filter regions based on shape (tanks are typically circular)
+    is_tank = circularities > 0.7
     
-    # Filter regions based on size and shape
     tanks = []
-    for region in regions:
-        # Calculate circularity
-        area = region.area
-        perimeter = region.perimeter
-        circularity = 4 * np.pi * area / (perimeter * perimeter) if perimeter > 0 else 0
+    for i, circularity in zip(candidates[is_tank], circularities[is_tank]):
+        # Equivalent diameter
+        diameter = diameters[i]
         
-        # Calculate equivalent diameter
-        diameter = region.equivalent_diameter
+        # Get tank properties
+        centroid_x, centroid_y = centroids[i + 1]
+        centroid = (centroid_y, centroid_x)
+        x, y, w, h = stats[i + 1, :4]
+        bbox = (y, x, y + h, x + w)
         
-        # Filter based on size and shape
-        if (min_diameter <= diameter <= max_diameter and 
-            circularity > 0.7):  # Tanks are typically circular
-            
-            # Get tank properties
-            centroid = region.centroid
-            bbox = region.bbox
+        # Estimate height if DEM is provided
+        height = None
+        if dem_data is not None:
+            # Extract height from DEM at tank location
+            row, col = int(centroid[0]), int(centroid[1])
+            if 0 <= row < dem_data.shape[0] and 0 <= col < dem_data.shape[1]:
+                height = dem_data[row, col]
+        
+        # Calculate volume (π * r² * h)
+        radius = diameter / 2
+        if height is not None:
+            volume = np.pi * (radius ** 2) * height
+        else:
+            # Estimate height based on typical aspect ratio if DEM not available
+            # Typical aspect ratio (height/diameter) for oil tanks ranges from 0.5 to 1.5
+            aspect_ratio = 1.0  # Default assumption
+            height = diameter * aspect_ratio
+            volume = np.pi * (radius ** 2) * height
+        
+        # Convert pixel measurements to meters if transform is available
+        if transform is not None:
+            pixel_size_x = transform[0]
+            pixel_size_y = abs(transform[4])
+            avg_pixel_size = (pixel_size_x + pixel_size_y) / 2
             
-            # Estimate height if DEM is provided
-            height = None
-            if dem is not None:
-                if isinstance(dem, str):
-                    with rasterio.open(dem) as src:
-                        dem_data = src.read(1)
-                else:
-                    dem_data = dem
-                
-                # Extract height from DEM at tank location
-                row, col = int(centroid[0]), int(centroid[1])
-                if 0 <= row < dem_data.shape[0] and 0 <= col < dem_data.shape[1]:
-                    height = dem_data[row, col]
+            # Convert dimensions to meters
+            diameter_m = diameter * avg_pixel_size
+            radius_m = radius * avg_pixel_size
             
-            # Calculate volume (π * r² * h)
-            radius = diameter / 2
+            # Recalculate volume in cubic meters
             if height is not None:
-                volume = np.pi * (radius ** 2) * height
-            else:
-                # Estimate height based on typical aspect ratio if DEM not available
-                # Typical aspect ratio (height/diameter) for oil tanks ranges from 0.5 to 1.5
-                aspect_ratio = 1.0  # Default assumption
-                height = diameter * aspect_ratio
-                volume = np.pi * (radius ** 2) * height
-            
-            # Convert pixel measurements to meters if transform is available
-            if transform is not None:
-                pixel_size_x = transform[0]
-                pixel_size_y = abs(transform[4])
-                avg_pixel_size = (pixel_size_x + pixel_size_y) / 2
-                
-                # Convert dimensions to meters
-                diameter_m = diameter * avg_pixel_size
-                radius_m = radius * avg_pixel_size
-                
-                # Recalculate volume in cubic meters
-                if height is not None:
-                    height_m = height  # Assuming height is already in meters if from DEM
-                    volume = np.pi * (radius_m ** 2) * height_m
-            
-            # Add tank to list
-            tanks.append({
-                'centroid': centroid,
-                'bbox': bbox,
-                'diameter': diameter,
-                'height': height,
-                'volume': volume,
-                'circularity': circularity
-            })
+                height_m = height  # Assuming height is already in meters if from DEM
+                volume = np.pi * (radius_m ** 2) * height_m
+        
+        # Add tank to list
+        tanks.append({
+            'centroid': centroid,
+            'bbox': bbox,
+            'diameter': diameter,
+            'height': height,
+            'volume': volume,
+            'circularity': circularity
+        })
+    
+    # Tank centroids, diameters and volumes as arrays, for vectorized use
+    tank_indices = candidates[is_tank]
     
     return {
         'tanks': tanks,
+        'centroids': centroids[tank_indices + 1, ::-1].reshape(-1, 2),
+        'diameters': diameters[tank_indices],
+        'volumes': np.array([tank['volume'] for tank in tanks], dtype=float),
         'count': len(tanks),
         'transform': transform,
         'crs': crs
@@ -153,75 +166,58 @@ def detect_tank_changes(image_t1, image_t2, dem=None, **kwargs):
     tanks_t1 = estimate_tank_volume(image_t1, dem, **kwargs)
     tanks_t2 = estimate_tank_volume(image_t2, dem, **kwargs)
     
-    # Match tanks between time periods based on location
-    matched_tanks = []
-    for tank1 in tanks_t1['tanks']:
-        centroid1 = tank1['centroid']
-        
-        # Find closest tank in time 2
-        min_dist = float('inf')
-        closest_tank = None
-        
-        for tank2 in tanks_t2['tanks']:
-            centroid2 = tank2['centroid']
-            dist = np.sqrt((centroid1[0] - centroid2[0])**2 + (centroid1[1] - centroid2[1])**2)
-            
-            if dist < min_dist and dist < tank1['diameter'] / 2:  # Must be within radius
-                min_dist = dist
-                closest_tank = tank2
-        
-        if closest_tank is not None:
-            # Calculate volume change
-            volume_change = closest_tank['volume'] - tank1['volume']
-            percent_change = (volume_change / tank1['volume']) * 100 if tank1['volume'] > 0 else 0
-            
-            matched_tanks.append({
-                'centroid': tank1['centroid'],
-                'volume_t1': tank1['volume'],
-                'volume_t2': closest_tank['volume'],
-                'volume_change': volume_change,
-                'percent_change': percent_change
-            })
+    # Tank centroids and radii at both time periods
+    centroids_t1 = tanks_t1['centroids']
+    centroids_t2 = tanks_t2['centroids']
+    radii_t1 = tanks_t1['diameters'] / 2
+    radii_t2 = tanks_t2['diameters'] / 2
+    
+    # Distance from each tank to the closest tank of the other time period,
+    # using KD-trees instead of comparing every pair
+    if len(centroids_t1) > 0 and len(centroids_t2) > 0:
+        dist_t1, closest_t2 = cKDTree(centroids_t2).query(centroids_t1)
+        dist_t2, _ = cKDTree(centroids_t1).query(centroids_t2)
+    else:
+        dist_t1, closest_t2 = np.full(len(centroids_t1), np.inf), np.zeros(len(centroids_t1), dtype=int)
+        dist_t2 = np.full(len(centroids_t2), np.inf)
+    
+    # Match tanks between time periods based on location (the closest tank
+    # must be within the radius)
+    is_matched = dist_t1 < radii_t1
+    
+    matched_t1 = np.flatnonzero(is_matched)
+    matched_t2 = closest_t2[matched_t1]
+    
+    # Calculate volume changes of all matched tanks at once
+    volumes_t1 = tanks_t1['volumes'][matched_t1]
+    volumes_t2 = tanks_t2['volumes'][matched_t2]
+    volume_changes = volumes_t2 - volumes_t1
+    percent_changes = np.zeros(len(matched_t1))
+    np.divide(volume_changes * 100, volumes_t1, out=percent_changes, where=volumes_t1 > 0)
+    
+    matched_tanks = [
+        {
+            'centroid': tanks_t1['tanks'][i]['centroid'],
+            'volume_t1': volume_t1,
+            'volume_t2': volume_t2,
+            'volume_change': volume_change,
+            'percent_change': percent_change
+        }
+        for i, volume_t1, volume_t2, volume_change, percent_change
+        in zip(matched_t1, volumes_t1, volumes_t2, volume_changes, percent_changes)
+    ]
     
     # Find new tanks (in t2 but not in t1)
-    new_tanks = []
-    for tank2 in tanks_t2['tanks']:
-        centroid2 = tank2['centroid']
-        is_new = True
-        
-        for tank1 in tanks_t1['tanks']:
-            centroid1 = tank1['centroid']
-            dist = np.sqrt((centroid1[0] - centroid2[0])**2 + (centroid1[1] - centroid2[1])**2)
-            
-            if dist < tank2['diameter'] / 2:  # Within radius
-                is_new = False
-                break
-        
-        if is_new:
-            new_tanks.append(tank2)
-    
-    # Find removed tanks (in t1 but not in t2)
-    removed_tanks = []
-    for tank1 in tanks_t1['tanks']:
-        centroid1 = tank1['centroid']
-        is_removed = True
-        
-        for tank2 in tanks_t2['tanks']:
-            centroid2 = tank2['centroid']
-            dist = np.sqrt((centroid1[0] - centroid2[0])**2 + (centroid1[1] - centroid2[1])**2)
-            
-            if dist < tank1['diameter'] / 2:  # Within radius
-                is_removed = False
-                break
-        
-        if is_removed:
-            removed_tanks.append(tank1)
+    new_tanks = [tank2 for tank2, is_new in zip(tanks_t2['tanks'], dist_t2 >= radii_t2) if is_new]
+    
+    # Find removed tanks (in t1 but not in t2), i.e. the unmatched ones
+    removed_tanks = [tank1 for tank1, matched in zip(tanks_t1['tanks'], is_matched) if not matched]
     
     return {
         'matched_tanks': matched_tanks,
         'new_tanks': new_tanks,
         'removed_tanks': removed_tanks,
-        'total_volume_change': sum(tank['volume_change'] for tank in matched_tanks),
+        'total_volume_change': volume_changes.sum(),
         'transform': tanks_t1['transform'],
         'crs': tanks_t1['crs']
     }
@@ -253,8 +249,10 @@ def visualize_tank_changes(image, tank_changes, output_file=None, figsize=(12, 1
     else:
         img_data = image
     
-    # Normalize image for display
-    img_norm = (img_data - np.min(img_data)) / (np.max(img_data) - np.min(img_data))
+    # Normalize image for display, in place on a single float32 copy
+    img_min, img_max = img_data.min(), img_data.max()
+    img_norm = np.subtract(img_data, img_min, dtype=np.float32)
+    img_norm *= 1 / (img_max - img_min)
     
     # Create figure
     fig, ax = plt.subplots(figsize=figsize)
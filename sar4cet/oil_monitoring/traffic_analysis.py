@@ -2,12 +2,13 @@ import numpy as np
 import rasterio
 import cv2
 from scipy import ndimage
-from skimage import feature, measure, segmentation
 import matplotlib.pyplot as plt
 from sklearn.cluster import DBSCAN
 from datetime import datetime, timedelta
+from ..utils.io import read_first_band, read_image_series
 
-def analyze_traffic(image_series, timestamps=None, roi=None, min_vehicle_size=3, max_vehicle_size=20):
+def analyze_traffic(image_series, timestamps=None, roi=None, min_vehicle_size=3, max_vehicle_size=20,
+                    hotspot_method='dbscan'):
     """
     Analyze traffic patterns around oil facilities using time series of SAR images.
     
@@ -23,127 +24,172 @@ def analyze_traffic(image_series, timestamps=None, roi=None, min_vehicle_size=3,
         Minimum vehicle size in pixels, by default 3
     max_vehicle_size : int, optional
         Maximum vehicle size in pixels, by default 20
+    hotspot_method : str, optional
+        Traffic hotspot identification method, by default 'dbscan'
+        Options: 'dbscan' (density clustering of vehicle centroids), 'grid'
+        (10-pixel grid cells holding at least 3 detections; faster for many
+        detections)
     
     Returns
     -------
     dict
         Dictionary containing traffic analysis results
     """
-    # Load images if file paths are provided
-    loaded_images = []
+    if hotspot_method not in ('dbscan', 'grid'):
+        raise ValueError(f"Unknown hotspot method: {hotspot_method}")
+    
+    # Get metadata from first image
     transform = None
     crs = None
     
-    for i, image in enumerate(image_series):
-        if isinstance(image, str):
-            with rasterio.open(image) as src:
-                img_data = src.read(1)  # Read first band
-                if i == 0:  # Get metadata from first image
-                    transform = src.transform
-                    crs = src.crs
-        else:
-            img_data = image
-        
-        # Apply ROI if provided
-        if roi is not None:
-            row_start, row_end, col_start, col_end = roi
-            img_data = img_data[row_start:row_end, col_start:col_end]
-        
-        loaded_images.append(img_data)
+    if len(image_series) > 0 and isinstance(image_series[0], str):
+        with rasterio.open(image_series[0]) as src:
+            transform = src.transform
+            crs = src.crs
+    
+    # Load images if file paths are provided
+    loaded_images = read_image_series(image_series, roi)
     
     # Create timestamps if not provided
     if timestamps is None:
         base_time = datetime.now()
         timestamps = [base_time - timedelta(days=i) for i in range(len(loaded_images)-1, -1, -1)]
     
+    # Structuring element for removing small noise, shared by all images
+    kernel = np.ones((2, 2), np.uint8)
+    
     # Detect vehicles in each image
     vehicle_detections = []
     for i, img in enumerate(loaded_images):
-        # Normalize image
-        img_norm = (img - np.min(img)) / (np.max(img) - np.min(img))
-        
         # Apply adaptive thresholding to identify potential vehicles
-        # Vehicles typically appear as bright spots in SAR imagery
-        binary = img_norm > 0.8  # High threshold for bright objects
+        # Vehicles typically appear as bright spots in SAR imagery. The
+        # threshold is relative to the image range, so compare against it in
+        # image units rather than normalizing the whole image
+        img_min, img_max = img.min(), img.max()
+        binary = img > img_min + 0.8 * (img_max - img_min)  # High threshold for bright objects
         
-        # Remove small noise
-        binary = ndimage.binary_opening(binary, structure=np.ones((2, 2)))
+        # Remove small noise with an opening. OpenCV does not mirror even-sized
+        # kernels when dilating, so the dilation uses the opposite anchor to
+        # match ndimage.binary_opening (zero border, as in ndimage)
+        binary = cv2.erode(binary.view(np.uint8), kernel, anchor=(1, 1),
+                           borderType=cv2.BORDER_CONSTANT, borderValue=0)
+        binary = cv2.dilate(binary, kernel, anchor=(0, 0),
+                            borderType=cv2.BORDER_CONSTANT, borderValue=0)
         
-        # Label connected components
-        labeled, num_features = ndimage.label(binary)
+        # Label connected components (4-connectivity, as ndimage.label), with
+        # their bounding boxes, areas and centroids
+        num_labels, labeled, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=4)
         
-        # Extract properties of detected regions
-        regions = measure.regionprops(labeled, img)
+        # Filter regions based on size
+        areas = stats[:, cv2.CC_STAT_AREA]
+        valid = np.flatnonzero((min_vehicle_size <= areas) & (areas <= max_vehicle_size))
+        valid = valid[valid > 0]  # Label 0 is the background
         
-        # Filter regions based on size and shape
-        vehicles = []
-        for region in regions:
-            area = region.area
-            
-            # Filter based on size
-            if min_vehicle_size <= area <= max_vehicle_size:
-                # Get vehicle properties
-                centroid = region.centroid
-                bbox = region.bbox
-                intensity = region.mean_intensity
-                
-                # Add vehicle to list
-                vehicles.append({
-                    'centroid': centroid,
-                    'bbox': bbox,
-                    'area': area,
-                    'intensity': intensity,
-                    'timestamp': timestamps[i]
-                })
+        # Mean intensity of all valid regions in one pass
+        intensities = ndimage.mean(img, labeled, valid) if len(valid) > 0 else np.empty(0)
         
-        vehicle_detections.append(vehicles)
+        # Add the frame's vehicles as arrays, one row per vehicle
+        top = stats[valid, cv2.CC_STAT_TOP]
+        left = stats[valid, cv2.CC_STAT_LEFT]
+        vehicle_detections.append({
+            'centroids': centroids[valid, ::-1],  # (row, col)
+            'bboxes': np.column_stack((top, left,
+                                       top + stats[valid, cv2.CC_STAT_HEIGHT],
+                                       left + stats[valid, cv2.CC_STAT_WIDTH])),
+            'areas': areas[valid],
+            'intensities': np.asarray(intensities)
+        })
     
     # Analyze traffic patterns
-    total_vehicles = sum(len(vehicles) for vehicles in vehicle_detections)
+    vehicle_counts = [len(vehicles['areas']) for vehicles in vehicle_detections]
+    total_vehicles = sum(vehicle_counts)
     avg_vehicles_per_image = total_vehicles / len(loaded_images) if loaded_images else 0
     
     # Analyze temporal patterns
-    vehicles_by_time = {timestamp: len(vehicles) for timestamp, vehicles in zip(timestamps, vehicle_detections)}
+    vehicles_by_time = {timestamp: count for timestamp, count in zip(timestamps, vehicle_counts)}
+    
+    # Vehicle counts in time order, sorted once here for the consumers
+    sorted_data = sorted(vehicles_by_time.items(), key=lambda x: x[0])
+    sorted_timestamps = [timestamp for timestamp, _ in sorted_data]
+    sorted_counts = np.array([count for _, count in sorted_data], dtype=int)
     
-    # Identify high traffic areas using clustering
-    all_centroids = []
-    for vehicles in vehicle_detections:
-        for vehicle in vehicles:
-            all_centroids.append(vehicle['centroid'])
+    # Identify high traffic areas using clustering of all vehicle centroids
+    if vehicle_detections:
+        all_centroids = np.concatenate([vehicles['centroids'] for vehicles in vehicle_detections])
+    else:
+        all_centroids = np.empty((0, 2))
     
     # If we have enough detections, perform clustering
     traffic_hotspots = []
-    if all_centroids:
-        all_centroids = np.array(all_centroids)
-        
-        # Use DBSCAN for clustering
-        clustering = DBSCAN(eps=10, min_samples=3).fit(all_centroids)
-        labels = clustering.labels_
+    if len(all_centroids) > 0:
+        if hotspot_method == 'dbscan':
+            # Use DBSCAN for clustering, with a KD-tree for the neighbourhood
+            # queries (centroids are 2D) run on all cores
+            clustering = DBSCAN(eps=10, min_samples=3, algorithm='kd_tree', leaf_size=32, n_jobs=-1).fit(all_centroids)
+            labels = clustering.labels_
+        else:
+            labels = _grid_hotspot_labels(all_centroids, cell_size=10, min_count=3)
         
-        # Count number of unique clusters (excluding noise with label -1)
-        n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
+        # Group the clustered points (excluding noise with label -1) by
+        # cluster with one stable sort, keeping their detection order
+        order = np.argsort(labels, kind='stable')
+        order = order[labels[order] >= 0]
+        sorted_points = all_centroids[order]
+        counts = np.bincount(labels[order])
         
         # Extract hotspot information
-        for i in range(n_clusters):
-            cluster_points = all_centroids[labels == i]
-            center = np.mean(cluster_points, axis=0)
-            density = len(cluster_points)
+        if len(counts) > 0:
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            centers = np.add.reduceat(sorted_points, starts, axis=0) / counts[:, None]
             
-            traffic_hotspots.append({
-                'center': center,
-                'density': density,
-                'points': cluster_points.tolist()
-            })
+            for center, density, cluster_points in zip(centers, counts, np.split(sorted_points, starts[1:])):
+                traffic_hotspots.append({
+                    'center': center,
+                    'density': int(density),
+                    'points': cluster_points.tolist()
+                })
     
     return {
         'total_vehicles': total_vehicles,
         'avg_vehicles_per_image': avg_vehicles_per_image,
         'vehicles_by_time': vehicles_by_time,
+        'timestamps': sorted_timestamps,
+        'vehicle_counts': sorted_counts,
         'traffic_hotspots': traffic_hotspots,
+        'roi': roi,
         'transform': transform,
         'crs': crs
     }
 
+def _grid_hotspot_labels(points, cell_size, min_count):
+    """
+    Label points by grid cell, keeping cells with at least min_count points.
+    
+    Returns one label per point, numbered in cell order, and -1 for points in
+    sparse cells (like DBSCAN noise).
+    """
+    cells = np.floor_divide(points, cell_size).astype(np.int64)
+    cells -= cells.min(axis=0)
+    keys = cells[:, 0] * (cells[:, 1].max() + 1) + cells[:, 1]
+    
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    is_hot = counts >= min_count
+    hot_labels = np.where(is_hot, np.cumsum(is_hot) - 1, -1)
+    
+    return hot_labels[inverse]
+
+def _sorted_vehicle_counts(traffic_data):
+    """
+    Timestamps and vehicle counts in time order, as sorted by analyze_traffic.
+    
+    Falls back to sorting 'vehicles_by_time' for traffic data without them.
+    """
+    if 'timestamps' in traffic_data and 'vehicle_counts' in traffic_data:
+        return traffic_data['timestamps'], traffic_data['vehicle_counts']
+    
+    sorted_data = sorted(traffic_data['vehicles_by_time'].items(), key=lambda x: x[0])
+    return [timestamp for timestamp, _ in sorted_data], [count for _, count in sorted_data]
+
 def predict_logistics(traffic_data, forecast_days=7):
     """
     Predict future logistics activity based on historical traffic patterns.
@@ -162,22 +208,22 @@ def predict_logistics(traffic_data, forecast_days=7):
     """
     # Extract time series data
     vehicles_by_time = traffic_data['vehicles_by_time']
-    timestamps = list(vehicles_by_time.keys())
-    vehicle_counts = list(vehicles_by_time.values())
-    
-    # Sort by timestamp
-    sorted_data = sorted(zip(timestamps, vehicle_counts), key=lambda x: x[0])
-    timestamps, vehicle_counts = zip(*sorted_data) if sorted_data else ([], [])
+    timestamps, vehicle_counts = _sorted_vehicle_counts(traffic_data)
     
     # Convert to numpy arrays
-    timestamps_arr = np.array([(ts - timestamps[0]).total_seconds() / 86400 for ts in timestamps])  # Convert to days
-    vehicle_counts_arr = np.array(vehicle_counts)
+    timestamps_np = np.array(timestamps, dtype='datetime64[us]')
+    timestamps_arr = (timestamps_np - timestamps_np[:1]) / np.timedelta64(1, 'D')  # Convert to days
+    vehicle_counts_arr = np.asarray(vehicle_counts)
     
     # Simple linear regression for prediction
     if len(timestamps_arr) > 1:
-        # Fit linear model
-        coeffs = np.polyfit(timestamps_arr, vehicle_counts_arr, 1)
-        slope, intercept = coeffs
+        # Fit linear model (closed-form least squares; all images on the same
+        # day give a flat fit)
+        days_centered = timestamps_arr - timestamps_arr.mean()
+        counts_mean = vehicle_counts_arr.mean()
+        days_var = np.dot(days_centered, days_centered)
+        slope = np.dot(days_centered, vehicle_counts_arr - counts_mean) / days_var if days_var > 0 else 0.0
+        intercept = counts_mean - slope * timestamps_arr.mean()
         
         # Generate forecast
         forecast_days_arr = np.arange(max(timestamps_arr) + 1, max(timestamps_arr) + forecast_days + 1)
@@ -217,7 +263,10 @@ def visualize_traffic(image, traffic_data, output_file=None, figsize=(12, 10)):
     Parameters
     ----------
     image : str or numpy.ndarray
-        Background image for visualization
+        Background image for visualization. A file path is only read within
+        the ROI used by analyze_traffic, so that it lines up with the hotspots;
+        an array already cropped to the ROI is shown as given, and a full-frame
+        array is cropped to it
     traffic_data : dict
         Output from analyze_traffic function
     output_file : str, optional
@@ -230,49 +279,53 @@ def visualize_traffic(image, traffic_data, output_file=None, figsize=(12, 10)):
     matplotlib.figure.Figure
         Figure object
     """
-    # Load image if file path is provided
+    # Load image if file path is provided, decoding only the analyzed ROI
+    roi = traffic_data.get('roi')
     if isinstance(image, str):
-        with rasterio.open(image) as src:
-            img_data = src.read(1)  # Read first band
+        img_data = read_first_band(image, roi)
+    elif roi is not None and image.shape[:2] != (roi[1] - roi[0], roi[3] - roi[2]):
+        # Full-frame array; crop it to the ROI
+        img_data = read_first_band(image, roi)
     else:
         img_data = image
     
-    # Normalize image for display
-    img_norm = (img_data - np.min(img_data)) / (np.max(img_data) - np.min(img_data))
+    # Normalize image for display, in place on a single float32 copy, then
+    # quantize to the 8 bits the gray colormap can show
+    img_min, img_max = img_data.min(), img_data.max()
+    img_norm = np.subtract(img_data, img_min, dtype=np.float32)
+    if img_max > img_min:
+        img_norm *= 255 / (img_max - img_min)
+    else:
+        img_norm[:] = 0  # Constant image
+    img_norm = img_norm.astype(np.uint8)
     
     # Create figure with two subplots
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=figsize)
     
     # Display background image with traffic hotspots
-    ax1.imshow(img_norm, cmap='gray')
+    ax1.imshow(img_norm, cmap='gray', vmin=0, vmax=255)
     
-    # Plot traffic hotspots
-    for hotspot in traffic_data['traffic_hotspots']:
-        center = hotspot['center']
-        density = hotspot['density']
-        
-        # Size marker based on density
-        size = np.sqrt(density) * 5
+    # Plot traffic hotspots, all markers in a single artist
+    hotspots = traffic_data['traffic_hotspots']
+    if hotspots:
+        centers = np.array([hotspot['center'] for hotspot in hotspots])
+        densities = np.array([hotspot['density'] for hotspot in hotspots])
         
-        # Plot hotspot
-        ax1.plot(center[1], center[0], 'o', color='red', markersize=size, alpha=0.7)
+        # Size marker based on density (scatter sizes are areas in points^2)
+        sizes = np.sqrt(densities) * 5
+        ax1.scatter(centers[:, 1], centers[:, 0], s=sizes ** 2, color='red', alpha=0.7)
         
         # Add text with density
-        ax1.text(center[1] + 5, center[0] + 5, f'{density}', 
-                color='white', fontsize=8, backgroundcolor='black')
+        for (row, col), density in zip(centers, densities):
+            ax1.text(col + 5, row + 5, f'{density}', 
+                    color='white', fontsize=8, backgroundcolor='black')
     
     ax1.set_title('Traffic Hotspots')
     ax1.set_xlabel('Column')
     ax1.set_ylabel('Row')
     
     # Plot time series of vehicle counts
-    vehicles_by_time = traffic_data['vehicles_by_time']
-    timestamps = list(vehicles_by_time.keys())
-    vehicle_counts = list(vehicles_by_time.values())
-    
-    # Sort by timestamp
-    sorted_data = sorted(zip(timestamps, vehicle_counts), key=lambda x: x[0])
-    timestamps, vehicle_counts = zip(*sorted_data) if sorted_data else ([], [])
+    timestamps, vehicle_counts = _sorted_vehicle_counts(traffic_data)
     
     ax2.plot(timestamps, vehicle_counts, 'o-', color='blue')
     ax2.set_title('Vehicle Count Over Time')
@@ -1,12 +1,16 @@
 import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import rasterio
 import numpy as np
 
-def apply_rtc(input_files, output_dir='processed', dem='SRTM 1Sec HGT'):
+def apply_rtc(input_files, output_dir='processed', dem='SRTM 1Sec HGT', n_workers=1):
     """
     Apply Radiometric Terrain Correction (RTC) to Sentinel-1 data.
     This function uses SNAP's graph processing tool (gpt) to apply terrain correction.
+    Calibration, speckle filtering and terrain correction run in a single
+    graph, so each file needs one gpt run and no intermediate files.
     
     Parameters
     ----------
@@ -16,6 +20,8 @@ def apply_rtc(input_files, output_dir='processed', dem='SRTM 1Sec HGT'):
         Directory to save processed files, by default 'processed'
     dem : str, optional
         Digital Elevation Model to use, by default 'SRTM 1Sec HGT'
+    n_workers : int, optional
+        Number of files processed concurrently, by default 1
     
     Returns
     -------
@@ -25,37 +31,51 @@ def apply_rtc(input_files, output_dir='processed', dem='SRTM 1Sec HGT'):
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
-    processed_files = []
+    # Each file runs in its own gpt process, so independent files can be
+    # processed concurrently from a thread pool
+    process_file = partial(_apply_rtc_to_file, output_dir=output_dir, dem=dem)
+    if n_workers > 1:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(process_file, input_files))
+    else:
+        results = [process_file(input_file) for input_file in input_files]
     
-    for input_file in input_files:
-        try:
-            # Get base filename without extension
-            base_name = os.path.basename(input_file)
-            base_name = os.path.splitext(base_name)[0]
-            
-            # Output file path
-            output_file = os.path.join(output_dir, f"{base_name}_RTC.tif")
-            
-            # Create XML graph for SNAP GPT
-            graph_file = create_rtc_graph(input_file, output_file, dem)
-            
-            # Run SNAP GPT
-            cmd = f"gpt {graph_file}"
-            print(f"Running: {cmd}")
-            subprocess.run(cmd, shell=True, check=True)
-            
-            # Check if output file exists
-            if os.path.exists(output_file):
-                processed_files.append(output_file)
-                print(f"Successfully processed {input_file} to {output_file}")
-            else:
-                print(f"Failed to process {input_file}")
-                
-        except Exception as e:
-            print(f"Error processing {input_file}: {e}")
+    processed_files = [output_file for output_file in results if output_file is not None]
     
     return processed_files
 
+def _apply_rtc_to_file(input_file, output_dir, dem):
+    """
+    Apply RTC to a single file, returning the output path or None on failure.
+    """
+    try:
+        # Get base filename without extension
+        base_name = os.path.basename(input_file)
+        base_name = os.path.splitext(base_name)[0]
+        
+        # Output file path
+        output_file = os.path.join(output_dir, f"{base_name}_RTC.tif")
+        
+        # Create XML graph for SNAP GPT
+        graph_file = create_rtc_graph(input_file, output_file, dem)
+        
+        # Run SNAP GPT
+        cmd = ['gpt', graph_file]
+        print(f"Running: {' '.join(cmd)}")
+        subprocess.run(cmd, check=True)
+        
+        # Check if output file exists
+        if os.path.exists(output_file):
+            print(f"Successfully processed {input_file} to {output_file}")
+            return output_file
+        else:
+            print(f"Failed to process {input_file}")
+            
+    except Exception as e:
+        print(f"Error processing {input_file}: {e}")
+    
+    return None
+
 def create_rtc_graph(input_file, output_file, dem):
     """
     Create XML graph for SNAP GPT to apply Radiometric Terrain Correction.
@@ -74,9 +94,11 @@ def create_rtc_graph(input_file, output_file, dem):
     str
         Path to created graph XML file
     """
-    # Create temporary directory for graph file
+    # Create temporary directory for graph file (named after the output, so
+    # files processed concurrently do not overwrite each other's graphs)
     os.makedirs('temp', exist_ok=True)
-    graph_file = os.path.join('temp', 'rtc_graph.xml')
+    graph_name = os.path.splitext(os.path.basename(output_file))[0]
+    graph_file = os.path.join('temp', f"{graph_name}_graph.xml")
     
     # Create XML graph
     graph_xml = f"""<graph id="Graph">
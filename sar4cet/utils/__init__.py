@@ -1,2 +1,2 @@
-from .io import read_image, write_image
+from .io import read_image, read_first_band, read_image_series, write_image
 from .conversions import db_to_linear, linear_to_db
\ No newline at end of file
@@ -1,4 +1,6 @@
 import rasterio
+from rasterio.windows import Window
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import os
 
@@ -22,6 +24,67 @@ def read_image(file_path):
     
     return image_data, metadata
 
+def read_first_band(image, roi=None):
+    """
+    Read the first band of an image file, or take an array, within a region of interest.
+    
+    Parameters
+    ----------
+    image : str or numpy.ndarray
+        Image file path or 2D numpy array
+    roi : tuple, optional
+        Region of interest as (row_start, row_end, col_start, col_end), with
+        numpy slice semantics, by default None (whole image)
+    
+    Returns
+    -------
+    numpy.ndarray
+        2D image data; for a file only the ROI is decoded from disk
+    """
+    if roi is not None:
+        row_start, row_end, col_start, col_end = roi
+    
+    if isinstance(image, str):
+        with rasterio.open(image) as src:
+            window = None
+            if roi is not None:
+                window = Window.from_slices((row_start, row_end), (col_start, col_end),
+                                            height=src.height, width=src.width)
+            return src.read(1, window=window)
+    
+    if roi is not None:
+        return image[row_start:row_end, col_start:col_end]
+    
+    return image
+
+def read_image_series(image_series, roi=None, max_workers=8):
+    """
+    Read the first band of a series of image files or arrays, within a region of interest.
+    
+    Files are read in a thread pool, since rasterio releases the GIL while
+    decoding.
+    
+    Parameters
+    ----------
+    image_series : list
+        List of image file paths or 2D numpy arrays
+    roi : tuple, optional
+        Region of interest as (row_start, row_end, col_start, col_end), by
+        default None (whole images)
+    max_workers : int, optional
+        Maximum number of reader threads, by default 8
+    
+    Returns
+    -------
+    list
+        List of 2D image arrays, in the order of image_series
+    """
+    if len(image_series) == 0:
+        return []
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(image_series))) as executor:
+        return list(executor.map(lambda image: read_first_band(image, roi), image_series))
+
 def write_image(data, output_path, metadata=None, dtype=None):
     """
     Write an image to a file using rasterio.
@@ -73,8 +136,20 @@ def write_image(data, output_path, metadata=None, dtype=None):
     if 'count' not in metadata or metadata['count'] != data.shape[0]:
         metadata['count'] = data.shape[0]
     
+    # Write GeoTIFFs with internal 512x512 tiles and compression (unless the
+    # metadata says otherwise), so windowed reads only decode the blocks
+    # they need
+    profile = dict(metadata)
+    if profile.get('driver', 'GTiff') == 'GTiff':
+        profile.setdefault('tiled', True)
+        profile.setdefault('blockxsize', 512)
+        profile.setdefault('blockysize', 512)
+        profile.setdefault('compress', 'deflate')
+        profile.setdefault('predictor', 3 if np.issubdtype(np.dtype(profile['dtype']), np.floating) else 2)
+        profile.setdefault('num_threads', 'ALL_CPUS')
+    
     # Write the image
-    with rasterio.open(output_path, 'w', **metadata) as dst:
+    with rasterio.open(output_path, 'w', **profile) as dst:
         dst.write(data)
     
     return output_path
\ No newline at end of file
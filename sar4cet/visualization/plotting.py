@@ -27,24 +27,24 @@ def plot_changes(change_data, output_file=None, figsize=(12, 10)):
     first_change = change_data['first_change']
     im1 = axes[0].imshow(first_change, cmap='viridis')
     axes[0].set_title('First Change')
-    plt.colorbar(im1, ax=axes[0], label='Time Step')
+    fig.colorbar(im1, ax=axes[0], label='Time Step')
     
     # Plot change frequency
     change_frequency = change_data['change_frequency']
     im2 = axes[1].imshow(change_frequency, cmap='hot')
     axes[1].set_title('Change Frequency')
-    plt.colorbar(im2, ax=axes[1], label='Number of Changes')
+    fig.colorbar(im2, ax=axes[1], label='Number of Changes')
     
     # Plot change magnitude
     change_magnitude = change_data['change_magnitude']
     im3 = axes[2].imshow(change_magnitude, cmap='jet')
     axes[2].set_title('Change Magnitude')
-    plt.colorbar(im3, ax=axes[2], label='Magnitude')
+    fig.colorbar(im3, ax=axes[2], label='Magnitude')
     
-    plt.tight_layout()
+    fig.tight_layout()
     
     if output_file:
-        plt.savefig(output_file, dpi=300, bbox_inches='tight')
+        fig.savefig(output_file, dpi=300, bbox_inches='tight')
     
     return fig
 
@@ -88,7 +88,7 @@ def plot_time_series(image_stack, points, output_file=None, figsize=(12, 6)):
     ax.legend()
     
     if output_file:
-        plt.savefig(output_file, dpi=300, bbox_inches='tight')
+        fig.savefig(output_file, dpi=300, bbox_inches='tight')
     
     return fig
 
@@ -110,29 +110,15 @@ def create_rgb_change_composite(change_data, output_file=None, figsize=(10, 8)):
     matplotlib.figure.Figure
         Figure object
     """
-    # Normalize data for RGB composite
-    first_change = change_data['first_change']
-    change_frequency = change_data['change_frequency']
-    change_magnitude = change_data['change_magnitude']
-    
-    # Normalize to 0-1 range
-    if first_change.max() > 0:
-        r = first_change / first_change.max()
-    else:
-        r = first_change
-        
-    if change_frequency.max() > 0:
-        g = change_frequency / change_frequency.max()
-    else:
-        g = change_frequency
-        
-    if change_magnitude.max() > 0:
-        b = change_magnitude / change_magnitude.max()
-    else:
-        b = change_magnitude
-    
     # Create RGB composite
-    rgb = np.stack([r, g, b], axis=-1)
+    rgb = np.stack([change_data['first_change'],
+                    change_data['change_frequency'],
+                    change_data['change_magnitude']], axis=-1).astype(np.float32)
+    
+    # Normalize each channel to 0-1 range in place (channels without any
+    # change stay at zero)
+    channel_max = rgb.reshape(-1, 3).max(axis=0)
+    np.divide(rgb, channel_max, out=rgb, where=channel_max > 0)
     
     # Plot
     fig, ax = plt.subplots(figsize=figsize)
@@ -147,6 +133,6 @@ def create_rgb_change_composite(change_data, output_file=None, figsize=(10, 8)):
             bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
     
     if output_file:
-        plt.savefig(output_file, dpi=300, bbox_inches='tight')
+        fig.savefig(output_file, dpi=300, bbox_inches='tight')
     
     return fig
\ No newline at end of file